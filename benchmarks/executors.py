@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Compares overhead of concurrent executors on tiny tasks. Run it as
+
+    $ PYTHONPATH=. python benchmarks/executors.py
+"""
+
+
+###############################################################################
+
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+# noinspection PyUnresolvedReferences
+from six.moves import xrange
+
+from streams import Stream
+
+
+###############################################################################
+
+
+ELEMENTS = 200000
+WORKERS = 4
+
+
+def tiny(item):
+    return item + 1
+
+
+def measure(**concurrency_kwargs):
+    started_at = default_timer()
+    for _ in Stream(xrange(ELEMENTS)).map(tiny, **concurrency_kwargs):
+        pass
+    return default_timer() - started_at
+
+
+def main():
+    for title, kwargs in (("serial", {}),
+                          ("parallel", {"parallel": WORKERS}),
+                          ("light", {"light": WORKERS}),
+                          ("light, chunk 1024", {"light": WORKERS,
+                                                 "chunksize": 1024})):
+        elapsed = measure(**kwargs)
+        print("{0:20} {1:8.3f}s {2:10.0f} elements/s".format(
+            title, elapsed, ELEMENTS / elapsed))
+
+
+if __name__ == "__main__":
+    main()
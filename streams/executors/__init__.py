@@ -10,16 +10,40 @@ This is dynamically calculated class for default concurrent execution. If
 code is monkey patched by Gevent, then it uses
 :py:class:`streams.executors._gevent.GeventExecutor`. Otherwise -
 :py:class:`streams.executors.executors.ThreadPoolExecutor`.
+
+The same for :py:class:`streams.executors.CPUExecutor` which is the executor
+for CPU bound tasks. On free-threaded builds of CPython threads are really
+parallel so it is :py:class:`streams.executors.executors.ThreadPoolExecutor`.
+If sub-interpreters are available (Python 3.14+), it is
+:py:class:`streams.executors.executors.InterpreterPoolExecutor`. Otherwise -
+:py:class:`streams.executors.executors.ProcessPoolExecutor`.
 """
 
 
 ###############################################################################
 
 
-from sys import modules
-
 from .executors import SequentalExecutor, ThreadPoolExecutor, \
-    ProcessPoolExecutor
+    ProcessPoolExecutor, LightThreadPoolExecutor, InterpreterPoolExecutor
+
+
+def is_gil_enabled():
+    """
+    Checks if GIL is enabled (it is not on free-threaded builds of CPython).
+    """
+    try:
+        from sys import _is_gil_enabled
+    except ImportError:
+        return True
+    return _is_gil_enabled()
+
+
+if not is_gil_enabled():
+    CPUExecutor = ThreadPoolExecutor
+elif InterpreterPoolExecutor is not None:
+    CPUExecutor = InterpreterPoolExecutor
+else:
+    CPUExecutor = ProcessPoolExecutor
 
 
 ParallelExecutor = ThreadPoolExecutor
@@ -28,6 +52,7 @@ try:
 except ImportError:
     pass
 else:
+    from gevent.monkey import is_module_patched
     from ._gevent import GeventExecutor
-    if "gevent.monkey" in modules:
+    if is_module_patched("threading"):
         ParallelExecutor = GeventExecutor
@@ -16,10 +16,9 @@ sense to use custom one.
 
 from warnings import warn
 
-from concurrent.futures import Future, Executor
+from concurrent.futures import Future, Executor, TimeoutError
 
 try:
-    from gevent import Timeout
     from gevent.pool import Pool
 except ImportError:
     warn("No gevent is available. Please do not use GeventExecutor, it won't "
@@ -34,45 +33,111 @@ from .mixins import PoolOfPoolsMixin
 class GreenletFuture(Future):
     """
     Just a thin wrapper around a :py:class:`concurrent.futures.Future` to
-    support greenlets.
+    support greenlets. It is resolved by the link on the greenlet so it works
+    with :py:func:`concurrent.futures.wait` and other futures machinery.
     """
 
     def __init__(self, greenlet):
         super(GreenletFuture, self).__init__()
         self._greenlet = greenlet
+        greenlet.rawlink(self.resolve)
 
-    def execute(self, timeout=None):
-        try:
-            processed_result = self._greenlet.get(True, timeout)
-        except Timeout as exc:
-            self.set_exception(exc)
+    def resolve(self, greenlet):
+        if self.done():
+            return
+        if greenlet.successful():
+            self.set_result(greenlet.value)
         else:
-            if self._greenlet.exception:
-                self.set_exception(self._greenlet.exception)
-            else:
-                self.set_result(processed_result)
+            self.set_exception(greenlet.exception)
+
+    def join(self, timeout=None):
+        """
+        Waits for the greenlet cooperatively. Required if code is not monkey
+        patched: waiting on the condition of
+        :py:class:`concurrent.futures.Future` would block the hub then.
+        """
+        if not self.done():
+            self._greenlet.join(timeout)
+            if not self._greenlet.ready():
+                raise TimeoutError()
+            # links are notified by the hub a bit later
+            self.resolve(self._greenlet)
+
+    def cancel(self):
+        if self.done():
+            return super(GreenletFuture, self).cancel()
+        result = super(GreenletFuture, self).cancel()
+        self._greenlet.kill(block=False)
+        return result
 
     def result(self, timeout=None):
-        self.execute(timeout)
-        return super(GreenletFuture, self).result(timeout)
+        self.join(timeout)
+        return super(GreenletFuture, self).result(0)
 
     def exception(self, timeout=None):
-        self.execute(timeout)
-        return super(GreenletFuture, self).exception(timeout)
+        self.join(timeout)
+        return super(GreenletFuture, self).exception(0)
 
 
 class GeventExecutor(PoolOfPoolsMixin, Executor):
     """
     Implementation of Gevent executor fully compatible with
     :py:class:`concurrent.futures.Executor`.
+
+    The size of underlying :py:class:`gevent.pool.Pool` is the amount of
+    workers so it is properly resized on :py:meth:`GeventExecutor.expand`.
     """
 
+    SLOW_PATH_KWARGS = ("max_inflight", "timeout", "hedge", "priority",
+                        "deadline")
+
     # noinspection PyUnusedLocal
-    def __init__(self, *args, **kwargs):
+    def __init__(self, max_workers=100, *args, **kwargs):
         super(GeventExecutor, self).__init__()
-        self._max_workers = 100
+        self._max_workers = max_workers
         self.worker_pool = Pool(self._max_workers)
 
     def submit(self, fn, *args, **kwargs):
-        future = self.worker_pool.apply_async(fn, args, kwargs)
-        return GreenletFuture(future)
+        return GreenletFuture(self.worker_pool.spawn(fn, *args, **kwargs))
+
+    def expand(self, expand_to):
+        """
+        Replaces the underlying pool with the bigger one. Greenlets which
+        are still running are moved to the new pool so they occupy its
+        slots until they finish.
+        """
+        super(GeventExecutor, self).expand(expand_to)
+        worker_pool = Pool(self.worker_pool.size + expand_to)
+        for greenlet in list(self.worker_pool):
+            worker_pool.add(greenlet)
+        self.worker_pool = worker_pool
+
+    def map(self, fn, *iterables, **kwargs):
+        """
+        Concurrent mapper. If no ``max_inflight``, ``timeout``, ``hedge``,
+        ``priority`` or ``deadline`` is set, native
+        :py:meth:`gevent.pool.Pool.imap` is used. Otherwise please checkout
+        :py:meth:`streams.executors.mixins.PoolOfPoolsMixin.map`.
+        """
+        if any(kwargs.get(name) is not None
+               for name in self.SLOW_PATH_KWARGS):
+            return super(GeventExecutor, self).map(fn, *iterables, **kwargs)
+        return self.imap(fn, *iterables, **kwargs)
+
+    def imap(self, fn, *iterables, **kwargs):
+        """
+        Fast path of ``map`` based on :py:meth:`gevent.pool.Pool.imap`.
+        Greenlets are spawned in the pool of ``required_workers`` size so
+        the call never takes more greenlets than it has reserved.
+        """
+        callback = kwargs.get("callback", self.dummy_callback)
+        worker_count = kwargs.get("required_workers", self._max_workers)
+        worker_count = max(worker_count, 1)
+        iterator = Pool(worker_count).imap(fn, *iterables,
+                                           maxsize=worker_count)
+        try:
+            for result in iterator:
+                yield result
+        finally:
+            iterator.kill(block=False)
+            callback(self, worker_count)
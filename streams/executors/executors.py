@@ -4,19 +4,50 @@ This module has implementation of executors wrapped by
 :py:class:`streams.executors.mixins.PoolOfPoolsMixin` and applicable to work
 with :py:class:`streams.poolofpools.PoolOfPools`.
 
-Basically all of them are thin extensions of classes from
-:py:mod:`concurrent.futures`.
+Basically most of them are thin extensions of classes from
+:py:mod:`concurrent.futures`. The exception is
+:py:class:`LightThreadPoolExecutor` which is tuned for tiny tasks.
 """
 
 
 ###############################################################################
 
 
-from concurrent.futures import Executor, Future, \
-    ThreadPoolExecutor as BaseThreadPoolExecutor, \
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count, islice
+from sys import exc_info
+from threading import Condition, Event, Thread, Lock, local
+from time import time
+
+from concurrent.futures import Executor, Future, CancelledError, \
+    TimeoutError, ThreadPoolExecutor as BaseThreadPoolExecutor, \
     ProcessPoolExecutor as BaseProcessPoolExecutor
+try:
+    from concurrent.futures import \
+        InterpreterPoolExecutor as BaseInterpreterPoolExecutor
+except ImportError:
+    BaseInterpreterPoolExecutor = None
+from six import reraise
+# noinspection PyUnresolvedReferences
+from six.moves import zip as izip
+try:
+    from queue import SimpleQueue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from six.moves.queue import Queue as SimpleQueue
+# noinspection PyUnresolvedReferences
+from six.moves.queue import Empty, Queue
+
+from .mixins import PoolOfPoolsMixin, WORKER_THREAD, run_in_worker_thread
+
+
+###############################################################################
+
 
-from .mixins import PoolOfPoolsMixin
+STDLIB_WORK_QUEUES = SimpleQueue, Queue
+"""Types of the private work queue of stdlib thread pool (and its backport)
+which :py:class:`PriorityWorkQueue` is known to replace safely."""
 
 
 ###############################################################################
@@ -43,12 +74,167 @@ class SequentalExecutor(PoolOfPoolsMixin, Executor):
         return future
 
 
+class PriorityWorkQueue(object):
+    """
+    Work queue for :py:class:`ThreadPoolExecutor` which serves tasks by
+    the key ``submit time + deadline - priority * PRIORITY_QUANTUM`` instead
+    of the submission order. Tasks without deadline get
+    ``DEFAULT_DEADLINE`` so they are served in FIFO order among themselves.
+
+    Since key is based on submit time, old tasks become more urgent than
+    new ones with any priority eventually (aging) so background tasks are
+    not starved: priority ``1`` overtakes tasks submitted at most
+    ``PRIORITY_QUANTUM`` seconds earlier.
+
+    It implements the part of :py:class:`queue.Queue` interface which is
+    used by :py:class:`concurrent.futures.ThreadPoolExecutor`. The key of
+    the next put item is taken from thread local storage (see
+    :py:meth:`ThreadPoolExecutor.submit_scheduled`).
+    """
+
+    DEFAULT_DEADLINE = 1.0
+    PRIORITY_QUANTUM = 0.1
+    STOLEN = object()
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.counter = count()
+        self.condition = Condition(Lock())
+        self.local = local()
+
+    @classmethod
+    def make_key(cls, priority=0, deadline=None):
+        """
+        Calculates the key of the task.
+
+        :param float priority: The priority of the task (bigger is earlier).
+        :param float deadline: The time (in seconds) the task should be
+                               started in.
+        """
+        if deadline is None:
+            deadline = cls.DEFAULT_DEADLINE
+        return time() + deadline - priority * cls.PRIORITY_QUANTUM
+
+    def put(self, item, block=True, timeout=None):
+        if item is None:
+            # shutdown sentinel is served after all pending tasks
+            key = float("inf")
+        else:
+            key = getattr(self.local, "key", None)
+            if key is None:
+                key = self.make_key()
+        entry = [key, next(self.counter), item]
+        with self.condition:
+            heappush(self.heap, entry)
+            future = getattr(item, "future", None)
+            if future is not None:
+                self.entries[future] = entry
+            self.condition.notify()
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time() + timeout
+        with self.condition:
+            while True:
+                while self.heap:
+                    item = heappop(self.heap)[2]
+                    if item is not self.STOLEN:
+                        self.entries.pop(getattr(item, "future", None), None)
+                        return item
+                if not block:
+                    raise Empty()
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise Empty()
+                    self.condition.wait(remaining)
+
+    def steal(self, future):
+        """
+        Removes the work item of the ``future`` from the queue if it is not
+        taken by workers yet. Returns the work item or ``None``.
+        """
+        with self.condition:
+            entry = self.entries.pop(future, None)
+            if entry is None:
+                return None
+            item, entry[2] = entry[2], self.STOLEN
+            return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self, item):
+        return self.put(item, False)
+
+    def qsize(self):
+        return len(self.heap)
+
+    def empty(self):
+        return not self.heap
+
+
 class ThreadPoolExecutor(PoolOfPoolsMixin, BaseThreadPoolExecutor):
     """
     Implementation of :py:class:`concurrent.futures.ThreadPoolExecutor`
     applicable to work with :py:class:`streams.poolofpools.PoolOfPools`.
+
+    It uses :py:class:`PriorityWorkQueue` so tasks of several streams which
+    share the executor are served by priorities and deadlines. Also it
+    supports work stealing so nested concurrent streams do not deadlock.
+
+    .. note::
+        The queue replaces private ``_work_queue`` of the base class. Its
+        workers (CPython 2.7 backport up to 3.14) use only blocking
+        ``get(block=True)``, ``put`` of the work items and of ``None``
+        shutdown sentinel (which is put back for sibling workers) and
+        ``get_nowait`` until :py:class:`queue.Empty` to cancel pending items
+        on shutdown. If the base class has no work queue of known type,
+        it is kept and tasks are served in submission order.
     """
-    pass
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadPoolExecutor, self).__init__(*args, **kwargs)
+        if isinstance(getattr(self, "_work_queue", None), STDLIB_WORK_QUEUES):
+            self._work_queue = PriorityWorkQueue()
+
+    def submit(self, fn, *args, **kwargs):
+        return super(ThreadPoolExecutor, self).submit(
+            run_in_worker_thread, fn, *args, **kwargs)
+
+    def steal(self, future):
+        """
+        Executes the ``future`` in current thread if it is not taken by
+        workers yet. Returns ``True`` if it was executed.
+        """
+        if not isinstance(self._work_queue, PriorityWorkQueue):
+            return False
+        work_item = self._work_queue.steal(future)
+        if work_item is None:
+            return False
+        work_item.run()
+        return True
+
+    def submit_scheduled(self, priority, deadline, fn, *args, **kwargs):
+        """
+        Submits the task with given priority and deadline. Please checkout
+        :py:class:`PriorityWorkQueue` for details.
+
+        :param float priority: The priority of the task (bigger is earlier).
+        :param float deadline: The time (in seconds) the task should be
+                               started in.
+        :param Callable fn: Function to execute.
+        """
+        work_queue = self._work_queue
+        if not isinstance(work_queue, PriorityWorkQueue):
+            return self.submit(fn, *args, **kwargs)
+        work_queue.local.key = work_queue.make_key(priority, deadline)
+        try:
+            return self.submit(fn, *args, **kwargs)
+        finally:
+            work_queue.local.key = None
 
 
 class ProcessPoolExecutor(PoolOfPoolsMixin, BaseProcessPoolExecutor):
@@ -57,3 +243,253 @@ class ProcessPoolExecutor(PoolOfPoolsMixin, BaseProcessPoolExecutor):
     applicable to work with :py:class:`streams.poolofpools.PoolOfPools`.
     """
     pass
+
+
+if BaseInterpreterPoolExecutor is not None:
+    class InterpreterPoolExecutor(PoolOfPoolsMixin,
+                                  BaseInterpreterPoolExecutor):
+        """
+        Implementation of
+        :py:class:`concurrent.futures.InterpreterPoolExecutor` applicable to
+        work with :py:class:`streams.poolofpools.PoolOfPools`. Available on
+        Python 3.14+ only.
+        """
+        pass
+else:
+    InterpreterPoolExecutor = None
+
+
+class ResultSlot(object):
+    """
+    Lightweight replacement of :py:class:`concurrent.futures.Future` for
+    :py:class:`LightThreadPoolExecutor`. It has no waiters bookkeeping, the
+    waiting is done on a single :py:class:`threading.Event` which is set
+    with the result. The list of callbacks is created only if some callback
+    is added.
+
+    It supports the part of :py:class:`concurrent.futures.Future` interface
+    which is used by :py:class:`streams.executors.mixins.PoolOfPoolsMixin`.
+    """
+
+    __slots__ = "event", "token", "value", "error", "cancelled_", "task", \
+        "callbacks"
+
+    def __init__(self):
+        self.event = Event()
+        self.task = None
+        self.callbacks = None
+        self.token = [True]
+        self.value = None
+        self.error = None
+        self.cancelled_ = False
+
+    def claim(self):
+        """
+        Claims the slot for execution or cancellation. Only one claim
+        succeeds (:py:meth:`list.pop` is atomic).
+        """
+        try:
+            return self.token.pop()
+        except IndexError:
+            return False
+
+    def finish(self):
+        """
+        Marks the slot as done and executes callbacks. Every callback is
+        popped from the list (atomic operation) so it is executed exactly
+        once even if it is added concurrently.
+        """
+        self.event.set()
+        callbacks = self.callbacks
+        while callbacks:
+            try:
+                callback = callbacks.pop()
+            except IndexError:
+                return
+            callback(self)
+
+    def add_done_callback(self, callback):
+        if self.callbacks is None:
+            self.callbacks = []
+        self.callbacks.append(callback)
+        if self.event.is_set():
+            self.finish()
+
+    def set_result(self, value):
+        self.value = value
+        self.finish()
+
+    def set_exception(self, error):
+        self.error = error
+        self.finish()
+
+    def done(self):
+        return self.event.is_set()
+
+    def cancelled(self):
+        return self.cancelled_
+
+    def cancel(self):
+        if not self.claim():
+            return self.cancelled_
+        self.task = None
+        self.cancelled_ = True
+        self.finish()
+        return True
+
+    def result(self, timeout=None):
+        # Event.wait returns None on Python 2.6 so the flag is checked.
+        self.event.wait(timeout)
+        if not self.event.is_set():
+            raise TimeoutError()
+        if self.cancelled_:
+            raise CancelledError()
+        if self.error is not None:
+            reraise(*self.error)
+        return self.value
+
+    def exception(self, timeout=None):
+        try:
+            self.result(timeout)
+        except (CancelledError, TimeoutError):
+            raise
+        except Exception as exc:
+            return exc
+
+
+# noinspection PyBroadException
+def run_chunk(fn, chunk):
+    """
+    Executes ``fn`` for every tuple of arguments from the ``chunk``.
+    Returns the tuple of (``results`` and ``exc_info``) where ``exc_info``
+    is not ``None`` if some execution has failed (``results`` are the
+    results before the failed one).
+    """
+    results = []
+    try:
+        for args in chunk:
+            results.append(fn(*args))
+    except Exception:
+        return results, exc_info()
+    return results, None
+
+
+def unchunk(chunks):
+    """
+    Flattens results of :py:func:`run_chunk` reraising exception in place.
+    """
+    for results, error in chunks:
+        for result in results:
+            yield result
+        if error is not None:
+            reraise(*error)
+
+
+class LightThreadPoolExecutor(PoolOfPoolsMixin, Executor):
+    """
+    Thread pool executor tuned for tiny tasks. Unlike
+    :py:class:`ThreadPoolExecutor` it uses :py:class:`ResultSlot` instead of
+    full :py:class:`concurrent.futures.Future`, lock free
+    :py:class:`queue.SimpleQueue` for tasks and ``map`` sends elements to
+    workers by chunks so one wakeup of the worker processes many elements.
+    """
+
+    CHUNK_SIZE = 64
+
+    def __init__(self, max_workers=1, *args, **kwargs):
+        super(LightThreadPoolExecutor, self).__init__()
+        self._max_workers = max_workers
+        self.tasks = SimpleQueue()
+        self.threads = []
+        self.threads_lock = Lock()
+        self.is_shutdown = False
+
+    def work(self):
+        """
+        The body of the worker thread.
+        """
+        WORKER_THREAD.active = True
+        tasks = self.tasks
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            self.run(*task)
+
+    # noinspection PyBroadException
+    @staticmethod
+    def run(slot, fn, args, kwargs):
+        """
+        Executes the task if its slot is not claimed yet. Returns ``True``
+        if it was executed.
+        """
+        if not slot.claim():
+            return False
+        slot.task = None
+        try:
+            slot.set_result(fn(*args, **kwargs))
+        except BaseException:
+            slot.set_exception(exc_info())
+        return True
+
+    def steal(self, slot):
+        """
+        Executes the task of the ``slot`` in current thread if it is not
+        taken by workers yet. Returns ``True`` if it was executed.
+        """
+        task = slot.task
+        if task is None:
+            return False
+        return self.run(*task)
+
+    def adjust_threads(self):
+        """
+        Starts new worker threads up to ``_max_workers``.
+        """
+        if len(self.threads) >= self._max_workers:
+            return
+        with self.threads_lock:
+            while len(self.threads) < self._max_workers:
+                thread = Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        if self.is_shutdown:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        slot = ResultSlot()
+        slot.task = slot, fn, args, kwargs
+        self.tasks.put(slot.task)
+        self.adjust_threads()
+        return slot
+
+    def map(self, fn, *iterables, **kwargs):
+        """
+        Concurrent mapper which sends elements to workers by chunks of
+        ``chunksize`` elements. Please checkout
+        :py:meth:`streams.executors.mixins.PoolOfPoolsMixin.map` for other
+        arguments.
+
+        .. note::
+            ``hedge`` is not supported. ``timeout`` and ``max_inflight``
+            are applied to chunks, not to elements: ``timeout`` limits the
+            processing of the whole chunk and ``max_inflight`` is the number
+            of chunks in flight.
+        """
+        if kwargs.get("hedge") is not None:
+            raise ValueError("Hedging is not supported by light executor")
+        chunksize = kwargs.pop("chunksize", None) or self.CHUNK_SIZE
+        args_iterator = izip(*iterables)
+        chunks = iter(lambda: tuple(islice(args_iterator, chunksize)), ())
+        chunks = super(LightThreadPoolExecutor, self).map(
+            partial(run_chunk, fn), chunks, **kwargs)
+        return unchunk(chunks)
+
+    def shutdown(self, wait=True, *args, **kwargs):
+        self.is_shutdown = True
+        for _ in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 """
-This module provides :py:class:`PoolOfPoolMixin` only. Basically you need to
-mix it into :py:class:`concurrent.futures.Executor` implementation and it will
-be possible to use it with :py:class:`PoolOfPools`.
+This module provides :py:class:`PoolOfPoolMixin` (and its small helper,
+:py:class:`LatencyTracker`). Basically you need to mix it into
+:py:class:`concurrent.futures.Executor` implementation and it will be possible
+to use it with :py:class:`PoolOfPools`.
 """
 
 
@@ -10,8 +11,14 @@ be possible to use it with :py:class:`PoolOfPools`.
 
 
 from collections import deque
+from functools import partial
 from itertools import islice
 from sys import exc_info
+from threading import Lock, local
+from time import time
+
+from concurrent.futures import wait, CancelledError, Future, \
+    FIRST_COMPLETED, TimeoutError
 
 from six import reraise
 # noinspection PyUnresolvedReferences
@@ -21,6 +28,178 @@ from six.moves import zip as izip
 ###############################################################################
 
 
+WORKER_THREAD = local()
+
+
+###############################################################################
+
+
+def run_in_worker_thread(fn, *args, **kwargs):
+    """
+    Marks current thread as a worker one (see :py:func:`is_worker_thread`)
+    and executes the task. Executors wrap submitted tasks with it since
+    thread initializers are not supported by all versions of
+    :py:mod:`concurrent.futures`.
+    """
+    WORKER_THREAD.active = True
+    return fn(*args, **kwargs)
+
+
+def is_worker_thread():
+    """
+    Checks if current thread is a worker thread of some executor. Such
+    threads help to execute futures they wait for and they never wait for
+    the limits of workers: it is the way to deadlock on nested streams.
+    """
+    return getattr(WORKER_THREAD, "active", False)
+
+
+def call_when_done(futures, callback):
+    """
+    Executes ``callback`` (without arguments) when all ``futures`` are done.
+    If there are no futures, it is executed immediately.
+    """
+    if not futures:
+        return callback()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def future_done(_):
+        with lock:
+            remaining[0] -= 1
+            finished = not remaining[0]
+        if finished:
+            callback()
+
+    for future in futures:
+        future.add_done_callback(future_done)
+
+
+class LatencyTracker(object):
+    """
+    Tracks latencies of the latest tasks to estimate the percentile for
+    hedging (checkout ``hedge`` argument of :py:meth:`PoolOfPoolsMixin.map`).
+    """
+
+    def __init__(self, percentile, size=100, min_samples=10):
+        """
+        Constructor of the class.
+
+        :param float percentile: The percentile to estimate (0 < x < 1).
+        :param int size: The number of the latest latencies to keep.
+        :param int min_samples: The minimal number of latencies to estimate
+                                percentile.
+        """
+        assert 0 < percentile < 1
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=size)
+
+    def track(self, future):
+        """
+        Starts tracking of the ``future`` latency.
+        """
+        future.submitted_at = time()
+        future.add_done_callback(self.future_done)
+
+    def future_done(self, future):
+        """
+        Callback for the finished future.
+        """
+        if not future.cancelled():
+            self.latencies.append(time() - future.submitted_at)
+
+    def threshold(self):
+        """
+        Returns the estimation of the percentile of latencies or ``None``
+        if there are not enough latencies tracked.
+        """
+        latencies = sorted(self.latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(int(len(latencies) * self.percentile), len(latencies) - 1)
+        return latencies[index]
+
+
+class Throttle(object):
+    """
+    Submits tasks keeping at most ``limit`` of them in the executor. Other
+    tasks wait in the local queue as pending
+    :py:class:`concurrent.futures.Future` instances and are submitted when
+    running ones are done. So ``max_inflight`` bigger than the amount of
+    reserved workers doesn't occupy other workers of shared executor.
+
+    Futures of delayed tasks keep submitted future in ``submitted``
+    attribute (to steal it, see :py:meth:`PoolOfPoolsMixin.help_with`).
+    """
+
+    def __init__(self, submit, limit):
+        """
+        Constructor of the class.
+
+        :param Callable submit: The function to submit tasks with.
+        :param int limit: The maximal number of tasks in the executor.
+        """
+        assert limit > 0
+
+        self.submit = submit
+        self.free = limit
+        self.pending = deque()
+        self.lock = Lock()
+
+    def __call__(self, fn, *args):
+        with self.lock:
+            if self.free:
+                self.free -= 1
+                future = None
+            else:
+                future = Future()
+                self.pending.append((future, fn, args))
+        if future is None:
+            future = self.submit(fn, *args)
+            future.add_done_callback(self.task_done)
+        return future
+
+    # noinspection PyBroadException
+    def task_done(self, _):
+        """
+        Callback of the finished task. Submits the next pending task which
+        is not cancelled or frees the slot.
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.free += 1
+                    return
+                future, fn, args = self.pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.submitted_at = time()
+            try:
+                submitted = self.submit(fn, *args)
+            except Exception:
+                future.set_exception(exc_info()[1])
+                continue
+            future.submitted = submitted
+            submitted.add_done_callback(partial(self.chain, future))
+            submitted.add_done_callback(self.task_done)
+            return
+
+    # noinspection PyBroadException
+    @staticmethod
+    def chain(future, submitted):
+        """
+        Copies the outcome of ``submitted`` future to the local ``future``.
+        """
+        try:
+            future.set_result(submitted.result())
+        except CancelledError:
+            future.set_exception(CancelledError())
+        except Exception:
+            future.set_exception(exc_info()[1])
+
+
 class PoolOfPoolsMixin(object):
     """
     Mixin to support :py:class:`streams.poolofpools.PoolOfPools` execution
@@ -42,9 +221,33 @@ class PoolOfPoolsMixin(object):
         """
         pass
 
+    def help_with(self, queue):
+        """
+        Work stealing. If current thread is a worker thread (predicate of
+        outer concurrent stream runs inner concurrent stream), it executes
+        pending futures from the ``queue`` inline instead of blocking until
+        the first one is done. So nested streams never deadlock even if all
+        workers wait for inner futures.
+
+        It works only for executors with ``steal`` method.
+
+        .. note::
+            Stolen tasks are executed inline till the end so they can't be
+            hedged. It is skipped if ``timeout`` is set since waiting for
+            the result is bounded anyway.
+
+        :param deque queue: The queue of futures.
+        """
+        if not is_worker_thread() or not hasattr(self, "steal"):
+            return
+        first_future = queue[0]
+        for future in list(queue):
+            if first_future.done():
+                return
+            self.steal(getattr(future, "submitted", future))
+
     # noinspection PyBroadException
-    @staticmethod
-    def get_first(queue):
+    def get_first(self, queue, timeout=None):
         """
         Extracts the result of the execution from the first element of the
         queue (to support order since a ``map`` is ordering function). Also
@@ -52,24 +255,102 @@ class PoolOfPoolsMixin(object):
         :py:class:`concurrent.futures.ThreadPoolExecutor` or
         :py:class:`concurrent.futures.ProcessPoolExecutor` do.
 
+        :param deque queue: The queue of futures.
+        :param float timeout: The time to wait for the result. If it is
+                              exceeded,
+                              :py:class:`concurrent.futures.TimeoutError` is
+                              raised.
+
         .. note::
             It relies on given implementation of ``map`` method in both
             :py:class:`concurrent.futures.ThreadPoolExecutor` and
             :py:class:`concurrent.futures.ProcessPoolExecutor` so if you
             see some differences in behaviour please create an issue.
         """
+        if timeout is None:
+            self.help_with(queue)
         first_future = queue.popleft()
         try:
-            result = first_future.result()
+            result = first_future.result(timeout)
         except:
             for future in queue:
                 future.cancel()
+            queue.appendleft(first_future)
             reraise(*exc_info())
         else:
             return result
         finally:
             first_future.cancel()
 
+    # noinspection PyBroadException
+    def get_first_hedged(self, fn, tracker, queue, timeout=None):
+        """
+        The same as :py:meth:`PoolOfPoolsMixin.get_first` but if the first
+        future runs longer than the percentile of latencies estimated by
+        ``tracker``, it submits duplicate task and takes the result of the
+        one which is finished first.
+
+        :param Callable fn: Function to execute.
+        :param LatencyTracker tracker: Tracker of task latencies.
+        :param deque queue: The queue of futures.
+        :param float timeout: The time to wait for the result (in total,
+                              including the wait before hedging).
+        """
+        if timeout is None:
+            self.help_with(queue)
+        deadline = None if timeout is None else time() + timeout
+        first_future = queue.popleft()
+        backup_future = None
+        try:
+            winner = first_future
+            threshold = tracker.threshold()
+            if threshold is not None and not first_future.done():
+                elapsed = time() - first_future.submitted_at
+                hedge_delay = max(threshold - elapsed, 0)
+                if deadline is not None:
+                    hedge_delay = min(hedge_delay, timeout)
+                wait([first_future], hedge_delay)
+                if not first_future.done():
+                    backup_future = self.submit(fn, *first_future.arguments)
+                    done, _ = wait([first_future, backup_future],
+                                   self.remaining_time(deadline),
+                                   FIRST_COMPLETED)
+                    if not done:
+                        raise TimeoutError()
+                    winner = first_future if first_future in done \
+                        else backup_future
+            result = winner.result(self.remaining_time(deadline))
+        except Exception:
+            for future in queue:
+                future.cancel()
+            queue.appendleft(first_future)
+            reraise(*exc_info())
+        else:
+            return result
+        finally:
+            first_future.cancel()
+            if backup_future is not None:
+                backup_future.cancel()
+
+    @staticmethod
+    def remaining_time(deadline):
+        """
+        Returns the time left till ``deadline`` (``None`` means no deadline).
+        """
+        if deadline is None:
+            return None
+        return max(deadline - time(), 0)
+
+    def submit_tracked(self, tracker, submit, fn, *args):
+        """
+        Submits the task with ``submit`` remembering its arguments and
+        tracking its latency for hedging.
+        """
+        future = submit(fn, *args)
+        future.arguments = args
+        tracker.track(future)
+        return future
+
     # noinspection PyUnresolvedReferences
     def expand(self, expand_to):
         """
@@ -96,36 +377,91 @@ class PoolOfPoolsMixin(object):
         """
         New implementation of concurrent mapper.
 
-        It has 2 new arguments: ``callback`` and ``required_workers``
+        It has 7 new arguments: ``callback``, ``required_workers``,
+        ``max_inflight``, ``timeout``, ``hedge``, ``priority`` and
+        ``deadline``.
 
         :param Callable callback:    Callback to execute after map is done
         :param int required_workers: The amount of workers we have to use
                                      for this map procedure.
+        :param int max_inflight:     The maximal number of tasks in flight
+                                     (the size of reorder buffer). By
+                                     default it is ``required_workers``. Set
+                                     it bigger to keep workers busy while
+                                     consumer processes results or waits for
+                                     the slow first task. Only
+                                     ``required_workers`` tasks are in the
+                                     executor at once, others wait locally
+                                     (see :py:class:`Throttle`).
+        :param float timeout:        The time to wait for the result of each
+                                     element since it became the first one
+                                     in the order. If it is exceeded,
+                                     ``TimeoutError`` from
+                                     :py:mod:`concurrent.futures` is raised.
+        :param float hedge:          The percentile of latencies (0 < x < 1).
+                                     If the first element in the order runs
+                                     longer than this percentile of recent
+                                     latencies, duplicate task is submitted
+                                     and the result of the fastest one is
+                                     taken. Use it only for idempotent
+                                     functions.
+        :param float priority:       The priority of tasks in the shared
+                                     queue of the executor (bigger is
+                                     served earlier). Supported only by
+                                     executors with ``submit_scheduled``
+                                     method (thread pools), ignored by
+                                     others.
+        :param float deadline:       The time (in seconds) the task should
+                                     be started in. Tasks with earlier
+                                     deadlines are served first. Supported
+                                     the same way as ``priority``.
 
-        It differs from default implementation in 2 ways:
+        It differs from default implementation in 3 ways:
             1. It uses the limit of workers (``required_workers``). It can be
                less than max workers defined on executor initialization
                hence it is possible to utilize the same executor for several
                tasks more efficient.
             2. It doesn't create a list of futures in memory. Actually it
-               creates only ``required_workers`` amount of futures and tries
+               creates only ``max_inflight`` amount of futures and tries
                to keep this count the same during whole procedure. Yes, it is
                not naturally concurrent execution because it just submits
                task by task but on big iterables it utilizes as less memory
                as possible providing reasonable concurrency.
+            3. If consumer stops early (closes the generator or throws it
+               away), pending futures are cancelled, nothing is submitted
+               anymore and ``callback`` is executed as soon as already
+               running tasks are done so workers are returned to the pool
+               only when they are really free.
         """
         callback = kwargs.get("callback", self.dummy_callback)
         worker_count = kwargs.get("required_workers", self._max_workers)
         worker_count = max(worker_count, 1)
+        inflight_count = max(kwargs.get("max_inflight") or worker_count, 1)
+        timeout = kwargs.get("timeout")
         queue = deque()
         args_iterator = izip(*iterables)
 
-        for args in islice(args_iterator, worker_count):
-            queue.append(self.submit(fn, *args))
-        for args in args_iterator:
-            yield self.get_first(queue)
-            queue.append(self.submit(fn, *args))
-        while queue:
-            yield self.get_first(queue)
+        submit, get_first = self.submit, self.get_first
+        priority, deadline = kwargs.get("priority"), kwargs.get("deadline")
+        if (priority is not None or deadline is not None) and \
+                hasattr(self, "submit_scheduled"):
+            submit = partial(self.submit_scheduled, priority or 0, deadline)
+        if inflight_count > worker_count:
+            submit = Throttle(submit, worker_count)
+        if kwargs.get("hedge") is not None:
+            tracker = LatencyTracker(kwargs["hedge"])
+            submit = partial(self.submit_tracked, tracker, submit)
+            get_first = partial(self.get_first_hedged, fn, tracker)
 
-        callback(self, worker_count)
+        try:
+            for args in islice(args_iterator, inflight_count):
+                queue.append(submit(fn, *args))
+            for args in args_iterator:
+                yield get_first(queue, timeout)
+                queue.append(submit(fn, *args))
+            while queue:
+                yield get_first(queue, timeout)
+        finally:
+            running = [future for future in queue
+                       if not future.cancel() and not future.done()]
+            call_when_done(running, partial(callback, self, worker_count))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides :py:class:`streams.executors.remote.RemoteExecutor`
+which executes tasks on worker daemons (on other hosts or on localhost) and
+:py:class:`streams.executors.remote.WorkerServer`, the daemon itself.
+
+To start a daemon execute
+
+    $ python -m streams.executors.remote 0.0.0.0:9000
+
+The daemon has to be able to import your functions (the same way as
+:py:mod:`multiprocessing` does) so run it with the same code base.
+
+Tasks and results are sent as pickles in length prefixed frames.
+
+.. warning::
+    Unpickling of data allows to execute arbitrary code so worker daemon
+    executes anything it receives. Never expose it to untrusted networks.
+"""
+
+
+###############################################################################
+
+
+from itertools import islice, repeat
+from socket import create_connection, error as SocketError
+from struct import Struct
+from sys import argv
+from threading import Lock, local
+from time import time
+
+# noinspection PyUnresolvedReferences
+from six.moves import cPickle as pickle, socketserver, zip as izip
+
+from .executors import ThreadPoolExecutor, run_chunk, unchunk
+
+
+###############################################################################
+
+
+FRAME_HEADER = Struct("!I")
+
+
+def send_frame(sock, obj):
+    """
+    Sends pickled ``obj`` into socket prefixing it with its length.
+
+    :param socket.socket sock: The socket to send to.
+    :param object obj: Any pickleable object.
+    """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    """
+    Reads exactly ``size`` bytes from the socket. Raises
+    :py:class:`EOFError` if socket is closed in the middle.
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    while size:
+        received = sock.recv_into(view, size)
+        if not received:
+            raise EOFError("Connection is closed")
+        view, size = view[received:], size - received
+    return bytes(data)
+
+
+def recv_frame(sock):
+    """
+    Reads the frame sent by :py:func:`send_frame` and unpickles it.
+
+    :param socket.socket sock: The socket to read from.
+    """
+    size = FRAME_HEADER.unpack(recv_exactly(sock, FRAME_HEADER.size))[0]
+    return pickle.loads(recv_exactly(sock, size))
+
+
+def parse_address(address):
+    """
+    Parses address in ``host:port`` format. Tuples are returned as is.
+    """
+    if isinstance(address, tuple):
+        return address
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def run_chunk_remotely(fn, chunk):
+    """
+    The same as :py:func:`streams.executors.executors.run_chunk` but drops
+    traceback from exception info since it can't be pickled.
+    """
+    results, error = run_chunk(fn, chunk)
+    if error is not None:
+        error = error[0], error[1], None
+    return results, error
+
+
+###############################################################################
+
+
+class TaskHandler(socketserver.BaseRequestHandler):
+    """
+    Handler of the connection to :py:class:`WorkerServer`. Executes tasks
+    one by one and sends results back.
+    """
+
+    def setup(self):
+        self.server.connections.add(self.request)
+
+    # noinspection PyBroadException
+    def handle(self):
+        while True:
+            try:
+                fn, args, kwargs = recv_frame(self.request)
+            except (EOFError, SocketError):
+                return
+            except Exception as exc:
+                # the frame is read completely but the task can't be
+                # unpickled (e.g. its module is missing here): it is the
+                # error of the task, not of the connection
+                reply = False, exc
+            else:
+                try:
+                    reply = True, fn(*args, **kwargs)
+                except Exception as exc:
+                    reply = False, exc
+            try:
+                send_frame(self.request, reply)
+            except SocketError:
+                return
+            except Exception as exc:
+                send_frame(self.request, (False, RuntimeError(repr(exc))))
+
+    def finish(self):
+        self.server.connections.discard(self.request)
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Worker daemon for :py:class:`RemoteExecutor`. Every connection is served
+    in its own thread.
+
+    >>> server = WorkerServer(("0.0.0.0", 9000))
+    >>> server.serve_forever()
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        socketserver.TCPServer.__init__(self, parse_address(address),
+                                        TaskHandler)
+        self.connections = set()
+
+    def stop(self):
+        """
+        Stops serving and closes all established connections.
+        """
+        self.shutdown()
+        self.server_close()
+        for connection in list(self.connections):
+            connection.close()
+
+
+class RemoteExecutor(ThreadPoolExecutor):
+    """
+    Executor which runs tasks on :py:class:`WorkerServer` daemons. Every
+    worker thread keeps its own connection to one of the daemons (they are
+    picked round-robin).
+
+    If the daemon is lost, the task is resubmitted to another one so your
+    functions have to be idempotent. Lost daemon is tried again in
+    ``RETRY_DELAY`` seconds. ``map`` sends elements by chunks of
+    ``chunksize`` elements.
+    """
+
+    CHUNK_SIZE = 16
+    RETRY_DELAY = 5.0
+
+    def __init__(self, max_workers=1, addresses=(), *args, **kwargs):
+        assert addresses, "Addresses of worker daemons are required"
+        super(RemoteExecutor, self).__init__(max_workers, *args, **kwargs)
+        self.addresses = [parse_address(address) for address in addresses]
+        self.lost_addresses = {}
+        self.connections = []
+        self.connections_lock = Lock()
+        self.next_address = 0
+        self.local = local()
+
+    def connect(self):
+        """
+        Establishes new connection to the next alive daemon (or lost one
+        which may be retried already).
+        """
+        while True:
+            with self.connections_lock:
+                retried_at = time() - self.RETRY_DELAY
+                alive = [address for address in self.addresses
+                         if self.lost_addresses.get(address, 0) <= retried_at]
+                if not alive:
+                    raise SocketError("All worker daemons are lost")
+                address = alive[self.next_address % len(alive)]
+                self.next_address += 1
+            try:
+                connection = create_connection(address)
+            except SocketError:
+                self.lose(address, None)
+                continue
+            with self.connections_lock:
+                self.lost_addresses.pop(address, None)
+                self.connections.append(connection)
+            return address, connection
+
+    def lose(self, address, connection):
+        """
+        Marks the daemon as lost and closes the connection to it.
+        """
+        with self.connections_lock:
+            self.lost_addresses[address] = time()
+            if connection is not None and connection in self.connections:
+                self.connections.remove(connection)
+        if connection is not None:
+            connection.close()
+
+    def call(self, fn, args, kwargs):
+        """
+        Executes a task on the daemon of the current worker thread.
+        Reconnects to another daemon and repeats if connection is lost.
+        """
+        while True:
+            if getattr(self.local, "connection", None) is None:
+                self.local.address, self.local.connection = self.connect()
+            try:
+                send_frame(self.local.connection, (fn, args, kwargs))
+                success, result = recv_frame(self.local.connection)
+            except (EOFError, SocketError):
+                self.lose(self.local.address, self.local.connection)
+                self.local.connection = None
+                continue
+            if not success:
+                raise result
+            return result
+
+    def submit(self, fn, *args, **kwargs):
+        return super(RemoteExecutor, self).submit(self.call, fn, args,
+                                                  kwargs)
+
+    def map(self, fn, *iterables, **kwargs):
+        """
+        Concurrent mapper which sends elements to daemons by chunks of
+        ``chunksize`` elements. Please checkout
+        :py:meth:`streams.executors.mixins.PoolOfPoolsMixin.map` for other
+        arguments.
+
+        .. note::
+            ``timeout``, ``hedge`` and ``max_inflight`` are applied to
+            chunks, not to elements.
+        """
+        chunksize = kwargs.pop("chunksize", None) or self.CHUNK_SIZE
+        args_iterator = izip(*iterables)
+        chunks = iter(lambda: tuple(islice(args_iterator, chunksize)), ())
+        chunks = super(RemoteExecutor, self).map(
+            run_chunk_remotely, repeat(fn), chunks, **kwargs)
+        return unchunk(chunks)
+
+    def shutdown(self, wait=True, *args, **kwargs):
+        super(RemoteExecutor, self).shutdown(wait, *args, **kwargs)
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    WorkerServer(argv[1]).serve_forever()
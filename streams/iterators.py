@@ -8,11 +8,21 @@ extension pack for :py:mod:`itertools`.
 ###############################################################################
 
 
-from operator import add
-from sys import version_info
+from collections import deque
+from itertools import chain, groupby, islice
+from mmap import mmap, ACCESS_READ
+from operator import add, itemgetter
+from os import fstat
+from sys import exc_info, version_info
+from threading import Condition, Event, Thread
+from time import time
 
-from repoze.lru import LRUCache
-from six import advance_iterator
+# noinspection PyUnresolvedReferences
+from six.moves.queue import Queue, Empty, Full
+
+from six import PY3, advance_iterator, iteritems, reraise
+
+from .storage import PickleLog
 
 
 ###############################################################################
@@ -60,6 +70,8 @@ def partly_distinct(iterable):
         Current implementation guarantees support for 10000 distinct values.
         If your cardinality is bigger, there might be some duplicates.
     """
+    from repoze.lru import LRUCache
+
     cache = LRUCache(10000)
     for item in iterable:
         if not cache.get(item):
@@ -112,6 +124,695 @@ def seed(function, seed_value):
         yield seed_value
 
 
+class TeeBuffer(object):
+    """
+    Shared state of the branches created by :py:func:`tee`. It pulls
+    ``iterable`` only once and keeps items only until the slowest branch
+    consumes them.
+
+    If ``max_lag`` is set, branch which is ahead of the slowest one by
+    ``max_lag`` items would block until others catch up. So it makes sense to
+    consume branches in different threads (greenlets) in that case otherwise
+    you will get a deadlock.
+    """
+
+    def __init__(self, iterable, copies, max_lag=None):
+        assert copies > 0
+        assert max_lag is None or max_lag > 0
+
+        self.iterator = iter(iterable)
+        self.max_lag = max_lag
+        self.items = deque()
+        self.offset = 0
+        self.positions = [0] * copies
+        self.exhausted = False
+        self.condition = Condition()
+
+    def trim(self):
+        """
+        Throws out items which were consumed by every branch.
+        """
+        slowest = min(self.positions)
+        while self.items and self.offset < slowest:
+            self.items.popleft()
+            self.offset += 1
+
+    def fetch(self):
+        """
+        Advances underlying iterator and stores the item in the buffer.
+        Returns ``False`` if iterator is exhausted.
+        """
+        try:
+            item = advance_iterator(self.iterator)
+        except StopIteration:
+            self.exhausted = True
+            return False
+        except Exception:
+            self.exhausted = True
+            raise
+        self.items.append(item)
+        return True
+
+    def branch(self, index):
+        """
+        Generator of the items for the branch with given ``index``.
+        """
+        positions, condition = self.positions, self.condition
+        try:
+            while True:
+                with condition:
+                    while positions[index] - self.offset >= len(self.items):
+                        if self.exhausted:
+                            return
+                        if self.max_lag is not None and \
+                                len(self.items) >= self.max_lag:
+                            condition.wait()
+                            continue
+                        if not self.fetch():
+                            condition.notify_all()
+                            return
+                    item = self.items[positions[index] - self.offset]
+                    positions[index] += 1
+                    self.trim()
+                    condition.notify_all()
+                yield item
+        finally:
+            with condition:
+                positions[index] = float("inf")
+                self.trim()
+                condition.notify_all()
+
+
+def tee(iterable, copies=2, max_lag=None):
+    """
+    Does almost the same as :py:func:`itertools.tee` but thread safe and with
+    a possibility to limit the gap between the fastest and the slowest
+    branches. Please checkout :py:class:`TeeBuffer` for details.
+
+    :param Iterable iterable: Iterable we want to split.
+    :param int copies: The number of branches.
+    :param int max_lag: Maximal number of buffered items. ``None`` means no
+                        limit.
+
+    >>> first, second = tee([1, 2, 3])
+    >>> list(first)
+    ... [1, 2, 3]
+    >>> list(second)
+    ... [1, 2, 3]
+
+    .. note::
+        Closed (or garbage collected) branch does not hold the buffer
+        anymore.
+    """
+    buffer_ = TeeBuffer(iterable, copies, max_lag)
+    return [buffer_.branch(index) for index in range(copies)]
+
+
+def window(iterable, size, step=None, partial=False):
+    """
+    Yields windows (tuples) of ``size`` consecutive items. Each new window
+    starts ``step`` items after the previous one. If ``step`` is not set,
+    it is the same as ``size`` so windows are tumbling (non overlapping).
+
+    :param Iterable iterable: Iterable we want to window.
+    :param int size: The size of the window.
+    :param int step: The step between windows.
+    :param bool partial: Yield last incomplete window or not.
+
+    >>> list(window(range(5), 2))
+    ... [(0, 1), (2, 3)]
+    >>> list(window(range(5), 2, partial=True))
+    ... [(0, 1), (2, 3), (4,)]
+    >>> list(window(range(5), 3, 1))
+    ... [(0, 1, 2), (1, 2, 3), (2, 3, 4)]
+    """
+    assert size > 0
+    step = size if step is None else step
+    assert step > 0
+
+    items = deque()
+    to_skip = 0
+    for item in iterable:
+        if to_skip:
+            to_skip -= 1
+            continue
+        items.append(item)
+        if len(items) == size:
+            yield tuple(items)
+            if step >= size:
+                items.clear()
+                to_skip = step - size
+            else:
+                for _ in range(step):
+                    items.popleft()
+    if partial and items:
+        yield tuple(items)
+
+
+def time_window(iterable, size, timestamp, step=None):
+    """
+    Yields windows (tuples) of items which timestamps are within
+    ``[start, start + size)``. Window starts are aligned to the multiples of
+    ``step`` (the same as ``size`` by default, so windows are tumbling).
+    Windows without items are not yielded.
+
+    :param Iterable iterable: Iterable we want to window. Items have to be
+                              ordered by timestamp.
+    :param number size: The duration of the window.
+    :param function timestamp: Function which extracts numerical timestamp
+                               from the item.
+    :param number step: The step between window starts.
+
+    >>> list(time_window([1, 2, 5, 6, 11], 5, lambda item: item))
+    ... [(1, 2), (5, 6), (11,)]
+    """
+    assert size > 0
+    step = size if step is None else step
+    assert step > 0
+
+    items = deque()
+    start = None
+    for item in iterable:
+        stamp = timestamp(item)
+        while items and stamp >= start + size:
+            yield tuple(element for element_stamp, element in items
+                        if element_stamp < start + size)
+            start += step
+            while items and items[0][0] < start:
+                items.popleft()
+        if not items:
+            start = ((stamp - size) // step + 1) * step
+        items.append((stamp, item))
+    while items:
+        yield tuple(element for element_stamp, element in items
+                    if element_stamp < start + size)
+        start += step
+        while items and items[0][0] < start:
+            items.popleft()
+
+
+def session_window(iterable, gap, timestamp):
+    """
+    Yields session windows (tuples): consecutive items are grouped together
+    while the difference between their timestamps does not exceed ``gap``.
+
+    :param Iterable iterable: Iterable we want to window. Items have to be
+                              ordered by timestamp.
+    :param number gap: Maximal inactivity gap within a session.
+    :param function timestamp: Function which extracts timestamp from the
+                               item.
+
+    >>> list(session_window([1, 2, 3, 10, 11, 20], 2, lambda item: item))
+    ... [(1, 2, 3), (10, 11), (20,)]
+    """
+    session = []
+    previous = None
+    for item in iterable:
+        stamp = timestamp(item)
+        if session and stamp - previous > gap:
+            yield tuple(session)
+            session = []
+        session.append(item)
+        previous = stamp
+    if session:
+        yield tuple(session)
+
+
+def rolling(iterable, size, aggregate, timestamp=None):
+    """
+    Calculates aggregate over sliding window incrementally: every new item
+    is added to aggregate and items which leave the window are evicted from
+    it, so the window is never recomputed.
+
+    If ``timestamp`` is not set, window contains last ``size`` items and
+    aggregates are yielded only for full windows. Otherwise window contains
+    items which timestamps are within ``(stamp - size, stamp]`` where
+    ``stamp`` is the timestamp of the current item and aggregate is yielded
+    for every item.
+
+    :param Iterable iterable: Iterable we want to aggregate.
+    :param number size: The size (or duration) of the window.
+    :param function aggregate: Factory of the aggregate, as a rule one of
+                               :py:class:`streams.utils.RollingAggregate`
+                               subclasses.
+    :param function timestamp: Function which extracts timestamp from the
+                               item.
+
+    >>> from streams.utils import RollingSum
+    >>> list(rolling(range(5), 3, RollingSum))
+    ... [3, 6, 9]
+    """
+    assert size > 0
+
+    aggregator = aggregate()
+    items = deque()
+    if timestamp is None:
+        for item in iterable:
+            aggregator.add(item)
+            items.append(item)
+            if len(items) > size:
+                aggregator.evict(items.popleft())
+            if len(items) == size:
+                yield aggregator.result()
+    else:
+        for item in iterable:
+            stamp = timestamp(item)
+            aggregator.add(item)
+            items.append((stamp, item))
+            while items[0][0] <= stamp - size:
+                aggregator.evict(items.popleft()[1])
+            yield aggregator.result()
+
+
+JOIN_TYPES = ("inner", "left", "right", "outer")
+
+
+def probe_table(probe, table, how):
+    """
+    Probes built hash ``table`` (key to the list of values mapping) with
+    ``(key, value)`` pairs from ``probe`` iterable. Yields
+    ``(key, (probe_value, table_value))`` pairs. Please checkout
+    :py:func:`hash_join` for the meaning of ``how``.
+    """
+    keep_unmatched_table = how in ("right", "outer")
+    keep_unmatched_probe = how in ("left", "outer")
+    matched = set()
+    for key, value in probe:
+        others = table.get(key)
+        if others is not None:
+            if keep_unmatched_table:
+                matched.add(key)
+            for other in others:
+                yield key, (value, other)
+        elif keep_unmatched_probe:
+            yield key, (value, None)
+    if keep_unmatched_table:
+        for key, others in iteritems(table):
+            if key not in matched:
+                for other in others:
+                    yield key, (None, other)
+
+
+def partition_pairs(pairs, partitions):
+    """
+    Spreads ``(key, value)`` pairs among ``partitions`` disk logs
+    (:py:class:`streams.storage.PickleLog`) according to the hash of the key.
+    """
+    logs = [PickleLog() for _ in range(partitions)]
+    for pair in pairs:
+        logs[hash(pair[0]) % partitions].append(pair)
+    return logs
+
+
+def build_hash_join(probe, build, how, memory_limit, partitions):
+    """
+    Hash join which builds hash table on the ``build`` side. If the
+    ``build`` side has more than ``memory_limit`` pairs, both sides are
+    partitioned to the disk (Grace hash join) and partitions are joined one
+    by one.
+    """
+    table, size = {}, 0
+    build = iter(build)
+    for key, value in build:
+        table.setdefault(key, []).append(value)
+        size += 1
+        if memory_limit is not None and size > memory_limit:
+            break
+    else:
+        for item in probe_table(probe, table, how):
+            yield item
+        return
+
+    spilled = ((key, value)
+               for key, values in iteritems(table) for value in values)
+    build_logs = partition_pairs(chain(spilled, build), partitions)
+    table.clear()
+    probe_logs = partition_pairs(probe, partitions)
+    for probe_log, build_log in zip(probe_logs, build_logs):
+        try:
+            table = {}
+            for key, value in build_log:
+                table.setdefault(key, []).append(value)
+            for item in probe_table(probe_log, table, how):
+                yield item
+        finally:
+            probe_log.close()
+            build_log.close()
+
+
+def hash_join(left, right, how="inner", build_left=False, memory_limit=None,
+              partitions=16):
+    """
+    Joins 2 iterables of ``(key, value)`` pairs building hash table on one
+    side. Yields ``(key, (left_value, right_value))`` pairs.
+
+    :param Iterable left: Left side of the join.
+    :param Iterable right: Right side of the join.
+    :param str how: The type of join: ``inner``, ``left``, ``right`` or
+                    ``outer``. Missing values are ``None``.
+    :param bool build_left: Build hash table on the left side (by default,
+                            it is built on the right one).
+    :param int memory_limit: The maximal number of pairs (not bytes) to
+                             keep in the hash table. If build side has more
+                             pairs, both sides are spilled to the disk.
+    :param int partitions: The number of disk partitions for spilling.
+
+    >>> list(hash_join([(1, "a"), (2, "b")], [(1, "c")]))
+    ... [(1, ("a", "c"))]
+    >>> list(hash_join([(1, "a"), (2, "b")], [(1, "c")], how="left"))
+    ... [(1, ("a", "c")), (2, ("b", None))]
+
+    .. note::
+        The order of the results is not guaranteed if data is spilled.
+    """
+    assert how in JOIN_TYPES
+    assert memory_limit is None or memory_limit > 0
+    assert partitions > 0
+
+    if not build_left:
+        return build_hash_join(left, right, how, memory_limit, partitions)
+
+    mirrored_how = {"left": "right", "right": "left"}.get(how, how)
+    joined = build_hash_join(right, left, mirrored_how, memory_limit,
+                             partitions)
+    return ((key, (left_value, right_value))
+            for key, (right_value, left_value) in joined)
+
+
+def merge_join(left, right, how="inner"):
+    """
+    Joins 2 iterables of ``(key, value)`` pairs which are already sorted
+    by key in ascending order. Yields ``(key, (left_value, right_value))``
+    pairs. Only values of the single key from the right side are kept in the
+    memory so it works in constant memory for unique keys.
+
+    :param Iterable left: Left side of the join.
+    :param Iterable right: Right side of the join.
+    :param str how: The type of join: ``inner``, ``left``, ``right`` or
+                    ``outer``. Missing values are ``None``.
+
+    >>> list(merge_join([(1, "a"), (2, "b")], [(2, "c"), (3, "d")]))
+    ... [(2, ("b", "c"))]
+    """
+    assert how in JOIN_TYPES
+
+    keep_left = how in ("left", "outer")
+    keep_right = how in ("right", "outer")
+    left_groups = groupby(left, itemgetter(0))
+    right_groups = groupby(right, itemgetter(0))
+    left_group = next(left_groups, None)
+    right_group = next(right_groups, None)
+
+    while left_group is not None and right_group is not None:
+        left_key, left_pairs = left_group
+        right_key, right_pairs = right_group
+        if left_key < right_key:
+            if keep_left:
+                for _, value in left_pairs:
+                    yield left_key, (value, None)
+            left_group = next(left_groups, None)
+        elif right_key < left_key:
+            if keep_right:
+                for _, value in right_pairs:
+                    yield right_key, (None, value)
+            right_group = next(right_groups, None)
+        else:
+            right_values = [value for _, value in right_pairs]
+            for _, value in left_pairs:
+                for right_value in right_values:
+                    yield left_key, (value, right_value)
+            left_group = next(left_groups, None)
+            right_group = next(right_groups, None)
+
+    while keep_left and left_group is not None:
+        for _, value in left_group[1]:
+            yield left_group[0], (value, None)
+        left_group = next(left_groups, None)
+    while keep_right and right_group is not None:
+        for _, value in right_group[1]:
+            yield right_group[0], (None, value)
+        right_group = next(right_groups, None)
+
+
+def mmap_lines(path, start=0, end=None):
+    """
+    Memory maps the file and yields its lines (without line separators,
+    ``\n`` or ``\r\n``) as :py:class:`memoryview` slices of the mapping so
+    no data is copied. On Python 2 mapping does not support
+    :py:class:`memoryview` so lines are :py:class:`str` copies.
+
+    :param str path: The path to the file.
+    :param int start: The offset of the first byte to read.
+    :param int end: The offset of the byte to stop at (not included).
+                    ``None`` means the end of the file.
+
+    >>> [bytes(line) for line in mmap_lines("/etc/hostname")]
+    ... [b'localhost']
+
+    .. note::
+        Slices keep the whole mapping alive so copy them (with
+        :py:func:`bytes` for example) if you need to keep lines for a long
+        time.
+    """
+    with open(path, "rb") as file_handler:
+        size = fstat(file_handler.fileno()).st_size
+        if not size:
+            return
+        mapping = mmap(file_handler.fileno(), 0, access=ACCESS_READ)
+
+    end = size if end is None else min(end, size)
+    view = memoryview(mapping) if PY3 else mapping
+    position = start
+    while position < end:
+        newline = mapping.find(b"\n", position, end)
+        if newline < 0:
+            newline = end
+        line_end = newline
+        if line_end > position and \
+                mapping[line_end - 1:line_end] == b"\r":
+            line_end -= 1
+        yield view[position:line_end]
+        position = newline + 1
+
+
+def read_lines(path):
+    """
+    Reads the file in binary mode and yields its lines without line
+    separators (only one ``\n`` or ``\r\n`` is stripped, like
+    :py:func:`mmap_lines` does). File is closed after iteration.
+
+    :param str path: The path to the file.
+    """
+    with open(path, "rb") as file_handler:
+        for line in file_handler:
+            if line[-1:] == b"\n":
+                line = line[:-1]
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            yield line
+
+
+class QueueFeeder(object):
+    """
+    Pulls items from iterable in the background thread and puts them into
+    bounded queue. If code is monkey patched by Gevent, thread is a greenlet.
+
+    Items are put as ``(item, exc_info)`` tuples: ``exc_info`` is not
+    ``None`` if iterable raised an exception. End of iterable is marked by
+    :py:attr:`QueueFeeder.DONE` item.
+    """
+
+    DONE = object()
+
+    def __init__(self, iterable, size):
+        """
+        Constructor of the class. Starts background thread immediately.
+
+        :param Iterable iterable: Iterable to pull items from.
+        :param int size: The maximal size of the queue.
+        """
+        assert size > 0
+
+        self.queue = Queue(size)
+        self.stopped = Event()
+        self.thread = Thread(target=self.feed, args=(iter(iterable),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, item):
+        """
+        Puts item into the queue unless feeder is stopped. Returns ``False``
+        if feeder is stopped.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, True, 0.1)
+            except Full:
+                continue
+            return True
+        return False
+
+    # noinspection PyBroadException
+    def feed(self, iterator):
+        """
+        The body of background thread.
+        """
+        try:
+            for item in iterator:
+                if not self.put((item, None)):
+                    return
+        except Exception:
+            self.put((None, exc_info()))
+        else:
+            self.put((self.DONE, None))
+
+    def get(self, timeout=None):
+        """
+        Returns next item from the queue (:py:attr:`QueueFeeder.DONE` if
+        iterable is exhausted). Reraises exception of iterable. Raises
+        :py:class:`Queue.Empty` if nothing was fetched within ``timeout``.
+        """
+        item, error = self.queue.get(True, timeout)
+        if error is not None:
+            reraise(*error)
+        return item
+
+    def stop(self):
+        """
+        Stops background thread.
+        """
+        self.stopped.set()
+
+
+def prefetch(iterable, size):
+    """
+    Pulls items from ``iterable`` in the background thread (greenlet if
+    monkey patched by Gevent) keeping up to ``size`` items ready. So slow
+    I/O of ``iterable`` overlaps with the processing of the items.
+
+    :param Iterable iterable: Iterable to prefetch.
+    :param int size: The maximal number of prefetched items.
+
+    >>> list(prefetch(range(5), 2))
+    ... [0, 1, 2, 3, 4]
+    """
+    feeder = QueueFeeder(iterable, size)
+    try:
+        while True:
+            item = feeder.get()
+            if item is QueueFeeder.DONE:
+                return
+            yield item
+    finally:
+        feeder.stop()
+
+
+def batch(iterable, size, max_wait=None):
+    """
+    Groups items into lists of ``size`` items. Last list may be shorter.
+
+    If ``max_wait`` is set, list is yielded after ``max_wait`` seconds since
+    its first item was fetched even if it is not full. Items are pulled in
+    the background thread (see :py:class:`QueueFeeder`) in that case so it
+    works even for slow sources which block for a long time.
+
+    :param Iterable iterable: Iterable we want to group.
+    :param int size: The maximal size of the list.
+    :param float max_wait: Maximal time (in seconds) to wait for the list
+                           to be full.
+
+    >>> list(batch(range(5), 2))
+    ... [[0, 1], [2, 3], [4]]
+    """
+    assert size > 0
+    assert max_wait is None or max_wait > 0
+
+    if max_wait is None:
+        iterator = iter(iterable)
+        while True:
+            chunk = list(islice(iterator, size))
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < size:
+                return
+
+    feeder = QueueFeeder(iterable, size)
+    try:
+        chunk, deadline = [], None
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time(), 0)
+            try:
+                item = feeder.get(timeout)
+            except Empty:
+                yield chunk
+                chunk, deadline = [], None
+                continue
+            if item is QueueFeeder.DONE:
+                break
+            if not chunk:
+                deadline = time() + max_wait
+            chunk.append(item)
+            if len(chunk) == size:
+                yield chunk
+                chunk, deadline = [], None
+        if chunk:
+            yield chunk
+    finally:
+        feeder.stop()
+
+
+def memoized_map(mapper, function, iterable, memoizer):
+    """
+    Maps ``function`` to the items of ``iterable`` with ``mapper`` (like
+    :py:func:`map` or concurrent mapper from
+    :py:class:`streams.poolofpools.PoolOfPools`) but looks up results in
+    ``memoizer`` first. Only missed items go to ``mapper`` so concurrent
+    workers share the cache even if they are processes. The order of
+    results is kept.
+
+    :param function mapper: Mapper to use for missed items.
+    :param function function: Function to map.
+    :param Iterable iterable: Items to map.
+    :param Memoizer memoizer: Cache of the results.
+
+    >>> from streams.storage import Memoizer
+    >>> list(memoized_map(map, abs, [-1, 1, -1], Memoizer()))
+    ... [1, 1, 1]
+
+    .. note::
+        Missed items which are processed concurrently are not deduplicated.
+    """
+    slots = deque()
+    ready = deque()
+
+    def misses():
+        for item in iterable:
+            found, result = memoizer.lookup(function, item)
+            if found:
+                slots.append((True, result))
+            else:
+                slots.append((False, item))
+                yield item
+
+    results = iter(mapper(function, misses()))
+    while True:
+        while slots and (slots[0][0] or ready):
+            cached, value = slots.popleft()
+            if not cached:
+                result = ready.popleft()
+                memoizer.store(function, value, result)
+                value = result
+            yield value
+        try:
+            ready.append(advance_iterator(results))
+        except StopIteration:
+            if not slots:
+                return
+
+
 if version_info < (3, 3):
     def accumulate(iterable, function=add):
         """
@@ -4,20 +4,149 @@
 ###############################################################################
 
 
-from collections import defaultdict
+from bisect import bisect_left, insort
+from collections import defaultdict, deque
 from functools import partial
+from itertools import islice
+from logging import getLogger
 from multiprocessing import cpu_count
-from threading import RLock
+from threading import Condition, RLock, local
+from time import time
+try:
+    from time import thread_time
+except ImportError:
+    # time.clock measures CPU time of the whole process (or even wall time
+    # on Windows), it cannot tell IO waits of the thread from computations
+    thread_time = None
 
-from six import iteritems, iterkeys, itervalues
+# noinspection PyUnresolvedReferences
+from six.moves import cPickle as pickle, map as imap
 
-from .executors import ParallelExecutor, ProcessPoolExecutor
-from .executors.mixins import PoolOfPoolsMixin
+from .executors import ParallelExecutor, ProcessPoolExecutor, \
+    LightThreadPoolExecutor, CPUExecutor
+from .executors.remote import RemoteExecutor
+from .executors.mixins import PoolOfPoolsMixin, is_worker_thread
 
 
 ###############################################################################
 
 
+LOG = getLogger(__name__)
+
+SCOPE = local()
+
+
+###############################################################################
+
+
+def scoped_workers():
+    """
+    Returns :py:class:`PoolOfPools` of the innermost ``with`` block in the
+    current thread or ``None`` if there is no such block.
+    """
+    stack = getattr(SCOPE, "stack", None)
+    if stack:
+        return stack[-1]
+
+
+class WorkersUnavailable(RuntimeError):
+    """
+    Raised by strict mappers (see :py:meth:`ExecutorPool.get`) if required
+    amount of workers can't be reserved.
+    """
+
+
+class WorkerLimit(object):
+    """
+    The limit of workers shared by all :py:class:`ExecutorPool` instances of
+    :py:class:`PoolOfPools`.
+
+    If the request exceeds free workers, it is clamped to the amount of free
+    workers (but waits for at least one) or, if ``wait`` is set, it waits
+    until all required workers are free.
+
+    Worker threads of executors and threads which already hold workers of
+    this limit never wait (they hold workers themselves so nested or chained
+    streams would deadlock), they get what is free, maybe nothing.
+
+    .. note::
+        Workers are counted per thread so they have to be released in the
+        thread which acquired them. Otherwise the acquiring thread never
+        waits anymore (it gets what is free).
+    """
+
+    def __init__(self, max_workers, wait=False):
+        """
+        Constructor of the class.
+
+        :param int max_workers: The maximal amount of workers in use.
+        :param bool wait: Wait for all required workers instead of clamping.
+        """
+        assert max_workers > 0
+
+        self.max_workers = max_workers
+        self.available = max_workers
+        self.wait = wait
+        self.condition = Condition()
+        self.local = local()
+
+    def acquire(self, required_workers, block=True, exact=False):
+        """
+        Reserves workers. Returns the amount of reserved ones.
+
+        :param int required_workers: The amount of workers user requires.
+        :param bool block: Wait for free workers. If it is not set, it may
+                           return 0.
+        :param bool exact: Reserve all required workers or nothing (return
+                           0) instead of clamping. If waiting is allowed, it
+                           waits for all of them like ``wait`` does.
+        """
+        held = getattr(self.local, "held", 0)
+        block = block and not held
+        if exact and required_workers > self.max_workers:
+            return 0
+        required_workers = min(required_workers, self.max_workers)
+        with self.condition:
+            needed = required_workers if self.wait or exact else 1
+            while block and self.available < needed:
+                self.condition.wait()
+            if exact and self.available < required_workers:
+                return 0
+            required_workers = min(required_workers, self.available)
+            self.available -= required_workers
+        self.local.held = held + required_workers
+        return required_workers
+
+    def release(self, count):
+        """
+        Returns reserved workers.
+
+        :param int count: The amount of reserved workers.
+        """
+        self.disown(count)
+        self.give_back(count)
+
+    def disown(self, count):
+        """
+        Stops counting workers as held by current thread. The first half of
+        :py:meth:`release` for workers which are still busy.
+
+        :param int count: The amount of reserved workers.
+        """
+        self.local.held = max(getattr(self.local, "held", 0) - count, 0)
+
+    def give_back(self, count):
+        """
+        Makes workers available again (may be called from any thread). The
+        second half of :py:meth:`release`.
+
+        :param int count: The amount of reserved workers.
+        """
+        with self.condition:
+            self.available += count
+            self.condition.notify_all()
+
+
 class ExecutorPool(object):
     """
     Executor pool for :py:class:`PoolOfPools` which does accurate and
@@ -34,12 +163,27 @@ class ExecutorPool(object):
     also. Task with 4 threads may continue to work in parallel but you have
     6 threads you can occupy. So this is the main idea.
 
-    Also it tries to squash pools into single instance if you have several
-    which idle by expanding an amount of workers in one instance throwing out
-    another one.
+    Free capacity of executors is kept in sorted index so the executor with
+    the smallest suitable capacity is found in logarithmic time (best fit).
+    Returned capacity is coalesced with the rest of free capacity of the
+    executor and if several executors are completely idle, they are squashed
+    into single instance by expanding an amount of workers in one instance
+    throwing out another one.
+
+    Mappers return their workers into the stack of the same amount of
+    workers without the lock and if the mapper with this amount of workers
+    is requested again, they are reused from the stack without the lock
+    also. So pipelines of many short streams of the same shape do not
+    contend on the lock. It is safe on free-threaded builds as well: only
+    single atomic operations are used there (:py:meth:`dict.get`,
+    :py:meth:`dict.setdefault`, :py:meth:`collections.deque.append` and
+    :py:meth:`collections.deque.pop`), each of them is guarded by the lock
+    of the object itself on such builds. Stacks are never removed from the
+    dictionary and the executor popped from the stack belongs to the
+    caller only.
     """
 
-    def __init__(self, worker_class):
+    def __init__(self, worker_class, limit=None, **worker_kwargs):
         """
         Constructor of the class. worker_class has to be a class which
         supports required interface and behaviour, it has to be an instance
@@ -47,153 +191,264 @@ class ExecutorPool(object):
 
         :param PoolOfPoolsMixin worker_class: The class of executors this pool
                                               has to maintain.
+        :param WorkerLimit limit: The limit of workers in use (may be shared
+                                  with other pools).
+        :param dict worker_kwargs: Additional keyword arguments for the
+                                   constructor of executors.
         """
         assert issubclass(worker_class, PoolOfPoolsMixin)
 
         self.worker_class = worker_class
-        self.workers = defaultdict(lambda: [])
+        self.limit = limit
+        self.worker_kwargs = worker_kwargs
+        self.names = {}
+        self.free = {}
+        self.index = []
+        self.idle = set()
+        self.released = {}
         self.lock = RLock()
 
-    def get_any(self):
+    @property
+    def workers(self):
+        """
+        Mapping of free capacity to the list of executors which have it.
+        """
+        with self.lock:
+            self.collect()
+            workers = defaultdict(lambda: [])
+            for availability, name in self.index:
+                workers[availability].append(self.names[name])
+            return workers
+
+    def get_any(self, **map_kwargs):
         """
         Returns any map function, it is undetermined how many workers does it
         have. As a rule, you get a minimal amount of workers within a pool of
         executors.
+
+        :param dict map_kwargs: Additional keyword arguments for the mapper,
+                                checkout ``map`` method of
+                                :py:class:`PoolOfPoolsMixin`.
         """
         with self.lock:
-            return self.get(min(iterkeys(self.workers)))
+            self.collect()
+            required_workers = self.index[0][0] if self.index else 1
+            return self.get(required_workers, **map_kwargs)
 
-    def get(self, required_workers):
+    def get(self, required_workers, strict=False, **map_kwargs):
         """
         Returns a mapper which guarantees that you can utilize given number of
-        workers.
+        workers. Workers are taken when iteration starts (please checkout
+        :py:meth:`map`) so mappers which are never consumed hold nothing.
 
         :param int required_workers: The number of workers you need to utilize
                                      for your task.
+        :param bool strict: Never clamp the number of workers. If the limit
+                            can't give all of them, mapper raises
+                            :py:class:`WorkersUnavailable` on the first
+                            iteration before consuming anything.
+        :param dict map_kwargs: Additional keyword arguments for the mapper,
+                                checkout ``map`` method of
+                                :py:class:`PoolOfPoolsMixin`.
         """
         assert required_workers > 0
 
-        with self.lock:
-            self.squash()
-            worker, availability = self.get_suitable_worker(required_workers)
-            if worker is None:
-                worker = self.worker_class(required_workers)
-                availability = required_workers
-            availability -= required_workers
-            if availability > 0:
-                self.workers[availability].append(worker)
+        return partial(self.map, required_workers, map_kwargs, strict)
 
-        return partial(worker.map,
-                       required_workers=required_workers,
-                       callback=self.worker_finished)
-
-    def squash(self):
+    def map(self, required_workers, map_kwargs, strict, fn, *iterables):
         """
-        Squashes pools and tries to minimize the amount of pools available to
-        avoid unnecessary fragmentation and complexity.
+        Mapper returned by :py:meth:`get`. It reserves workers on the first
+        iteration and returns them when it is exhausted or closed.
+
+        If the pool has a limit, the number may be clamped. If nothing is
+        available for the worker thread (nested stream) or for the thread
+        which consumes another mapper of the limit (chained streams), elements
+        are mapped serially. Strict mapper waits for all workers instead
+        (if it may wait) and raises :py:class:`WorkersUnavailable` if it
+        can't get them.
+
+        :param int required_workers: The number of workers to utilize.
+        :param dict map_kwargs: Additional keyword arguments for the mapper,
+                                checkout ``map`` method of
+                                :py:class:`PoolOfPoolsMixin`.
+        :param bool strict: Reserve exactly ``required_workers``.
+        :param Callable fn: The function to map.
+        :param list iterables: Iterables with arguments of ``fn``.
         """
-        if not self.workers:
-            return
-        with self.lock:
-            for avail in list(iterkeys(self.workers)):
-                if not self.workers[avail]:
-                    self.workers.pop(avail)
-            self.squash_workers(self.name_to_worker_mapping(),
-                                self.real_worker_availability())
-
-    def get_suitable_worker(self, required_workers):
+        if self.limit is not None:
+            required_workers = self.limit.acquire(
+                required_workers, not is_worker_thread(), strict)
+            if not required_workers and strict:
+                raise WorkersUnavailable("Required workers are busy")
+            if not required_workers:
+                for result in imap(fn, *iterables):
+                    yield result
+                return
+
+        results = None
+        try:
+            worker = None
+            released = self.released.get(required_workers)
+            if released:
+                try:
+                    worker = released.pop()
+                except IndexError:
+                    pass
+            if worker is None:
+                with self.lock:
+                    self.collect()
+                    worker = self.allocate(required_workers)
+            results = worker.map(fn, *iterables,
+                                 required_workers=required_workers,
+                                 callback=self.worker_finished,
+                                 **map_kwargs)
+            for result in results:
+                yield result
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+            if self.limit is not None:
+                # workers are given back by worker_finished when the tasks
+                # which are still running are done
+                self.limit.disown(required_workers)
+                if results is None:
+                    self.limit.give_back(required_workers)
+
+    def allocate(self, required_workers):
         """
-        Returns suitable executor which has required amount of workers. Returns
-        ``None`` if nothing is available.
-
-        Actually it returns a tuple of worker and a count of workers available
-        for utilization within a given pool. It may be more than
-        ``required_workers`` but it can't be less.
+        Takes ``required_workers`` from the executor with the smallest
+        suitable free capacity. Creates new executor if nothing is
+        available.
 
         :param int required_workers: The amount of workers user requires.
         """
         with self.lock:
-            min_available, suspected_workers = None, None
-            for availability, workers in iteritems(self.workers):
-                if availability >= required_workers:
-                    if min_available is None or min_available < availability:
-                        min_available = availability
-                        suspected_workers = workers
-            if min_available is not None:
-                return suspected_workers.pop(), min_available
-            return None, 0
+            position = bisect_left(self.index, (required_workers, -1))
+            if position == len(self.index):
+                return self.worker_class(required_workers,
+                                         **self.worker_kwargs)
+            availability, name = self.index.pop(position)
+            self.idle.discard(name)
+            availability -= required_workers
+            if availability > 0:
+                self.free[name] = availability
+                insort(self.index, (availability, name))
+            else:
+                self.free.pop(name)
+            return self.names[name]
 
     def worker_finished(self, worker, required_workers):
         """
         The callback used by
-        :py:class:`streams.executors.mixins.PoolOfPoolsMixin`.
+        :py:class:`streams.executors.mixins.PoolOfPoolsMixin`. It does not
+        take the lock (see the notes of the class), workers are collected by
+        :py:meth:`collect`.
+        """
+        if self.limit is not None:
+            self.limit.give_back(required_workers)
+        released = self.released.get(required_workers)
+        if released is None:
+            released = self.released.setdefault(required_workers, deque())
+        released.append(worker)
+
+    def collect(self):
+        """
+        Moves workers returned by :py:meth:`worker_finished` into the index.
         """
         with self.lock:
-            self.workers[required_workers].append(worker)
-
-    def name_to_worker_mapping(self):
+            for count, released in list(self.released.items()):
+                while True:
+                    try:
+                        worker = released.popleft()
+                    except IndexError:
+                        break
+                    self.release(worker, count)
+
+    def release(self, worker, count):
         """
-        Maps worker names (the result of applying :py:func:`id` to the
-        executor) to executor instances.
+        Returns ``count`` workers of the executor into the index, coalescing
+        them with its free capacity. Squashes completely idle executors.
         """
         with self.lock:
-            name_to_workers = {}
-            for workers in itervalues(self.workers):
-                name_to_workers.update(
-                    (id(worker), worker) for worker in workers
-                )
-            return name_to_workers
-
-    def real_worker_availability(self):
+            name = id(worker)
+            self.names[name] = worker
+            availability = self.free.get(name, 0)
+            if availability:
+                self.index.pop(bisect_left(self.index, (availability, name)))
+            availability += count
+            self.free[name] = availability
+            if availability >= worker._max_workers:
+                availability = self.squash(worker, availability)
+            insort(self.index, (availability, name))
+
+    def squash(self, worker, availability):
         """
-        Returns mapping of the name for the executor and it real availability.
-        Since :py:meth:`worker_finished` does not do any defragmentation of
-        availability it may be possible that internal structure contains
-        multiple controversial information about worker availability. This
-        method is intended to restore the truth.
+        Squashes completely idle ``worker`` with another completely idle
+        executor (if any) expanding the amount of workers in ``worker``.
+        Returns new availability of ``worker``.
         """
         with self.lock:
-            real_availability = defaultdict(lambda: [])
-            for avail, workers in iteritems(self.workers):
-                for wrk in workers:
-                    real_availability[id(wrk)].append(avail)
-            for name in iterkeys(real_availability):
-                real_availability[name] = max(real_availability[name])
-
-            availability_to_workers = defaultdict(lambda: [])
-            for worker_name, avail in iteritems(real_availability):
-                availability_to_workers[avail].append(worker_name)
-
-            return availability_to_workers
-
-    def squash_workers(self, names, avails):
-        """
-        Does actual squashing/defragmentation of internal structure.
-        """
-        self.workers = defaultdict(lambda: [])
-        avails_to_traverse = set(iterkeys(avails))
-        while avails_to_traverse:
-            minimal_avail = min(avails_to_traverse)
-            avails_to_traverse.discard(minimal_avail)
-            workers = avails[minimal_avail]
-            selected_worker = names[workers[0]]
-            if len(workers) == 1:
-                self.workers[minimal_avail] = [selected_worker]
-            else:
-                selected_worker.expand(minimal_avail * (len(workers) - 1))
-                extended_avail = minimal_avail * len(workers)
-                avails_to_traverse.add(extended_avail)
-            avails.pop(minimal_avail)
+            name = id(worker)
+            if not self.idle:
+                self.idle.add(name)
+                return availability
+            other_name = self.idle.pop()
+            other_availability = self.free.pop(other_name)
+            self.index.pop(bisect_left(self.index,
+                                       (other_availability, other_name)))
+            self.names.pop(other_name).shutdown(wait=False)
+            worker.expand(other_availability)
+            availability += other_availability
+            self.free[name] = availability
+            self.idle.add(name)
+            return availability
 
 
 class PoolOfPools(object):
     """
     Just a convenient interface to the set of multiple
     :py:class:`ExecutorPool` instances, nothing more.
+
+    :py:attr:`streams.Stream.WORKERS` is the global instance but you may
+    create your own ones to isolate workloads, e.g. to keep heavy batch
+    processing from occupying workers of latency sensitive streams. Pass it
+    with ``workers`` keyword
+
+    >>> batch_workers = PoolOfPools(max_workers=16)
+    >>> Stream(urls).map(requests.get, parallel=32, workers=batch_workers)
+
+    or use it as a context manager, then all streams created in the block
+    (in the current thread) use it.
+
+    >>> with PoolOfPools(max_workers=16, wait=True):
+    ...     Stream(urls).map(requests.get, parallel=8).to_jsonl(path)
+
+    .. note::
+        Executors are not shut down on exit of ``with`` block since streams
+        are lazy and may be consumed later.
     """
 
+    MAP_KWARGS = ("max_inflight", "timeout", "hedge", "chunksize",
+                  "priority", "deadline")
+
+    AUTO_SAMPLE_SIZE = 20
+    """The amount of elements to profile for ``concurrency="auto"``."""
+
+    AUTO_MIN_DURATION = 0.0001
+    """The duration of the element (in seconds) which is too small to gain
+    anything from concurrency."""
+
+    AUTO_CPU_RATIO = 0.5
+    """If CPU time is less than this ratio of wall time, predicate waits for
+    IO mostly and threads are used."""
+
+    AUTO_PICKLE_RATIO = 0.5
+    """If CPU time of the thread cannot be measured (no
+    :py:func:`time.thread_time`), processes are used only if pickling takes
+    less than this ratio of wall time."""
+
     @staticmethod
-    def get_from_pool(pool, required_workers):
+    def get_from_pool(pool, required_workers, **map_kwargs):
         """
         Fetches mapper from the pool.
 
@@ -202,17 +457,44 @@ class PoolOfPools(object):
                                      It can be ``None`` then
                                      :py:meth:`ExecutorPool.get_any` would be
                                      executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
         """
         if required_workers is None:
-            return pool.get_any()
-        return pool.get(required_workers)
+            return pool.get_any(**map_kwargs)
+        return pool.get(required_workers, **map_kwargs)
 
-    def __init__(self):
-        self.parallels = ExecutorPool(ParallelExecutor)
-        self.processes = ExecutorPool(ProcessPoolExecutor)
+    def __init__(self, max_workers=None, wait=False):
+        """
+        Constructor of the class.
+
+        :param int max_workers: The maximal amount of workers in use by all
+                                streams of this instance. ``None`` means no
+                                limit. Requests are clamped to free
+                                workers.
+        :param bool wait: Wait until all required workers are free instead of
+                          clamping the request.
+        """
+        self.limit = None
+        if max_workers is not None:
+            self.limit = WorkerLimit(max_workers, wait)
+        self.parallels = ExecutorPool(ParallelExecutor, self.limit)
+        self.processes = ExecutorPool(ProcessPoolExecutor, self.limit)
+        self.lights = ExecutorPool(LightThreadPoolExecutor, self.limit)
+        self.interpreters = ExecutorPool(CPUExecutor, self.limit)
+        self.remotes, self.remote_count = None, 0
         self.default_count = cpu_count()
 
-    def parallel(self, required_workers):
+    def __enter__(self):
+        if getattr(SCOPE, "stack", None) is None:
+            SCOPE.stack = []
+        SCOPE.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        SCOPE.stack.pop()
+
+    def parallel(self, required_workers, **map_kwargs):
         """
         Fetches parallel executor mapper from the underlying
         :py:class:`ExecutorPool`.
@@ -221,10 +503,13 @@ class PoolOfPools(object):
                                      It can be ``None`` then
                                      :py:meth:`ExecutorPool.get_any` would be
                                      executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
         """
-        return self.get_from_pool(self.parallels, required_workers)
+        return self.get_from_pool(self.parallels, required_workers,
+                                  **map_kwargs)
 
-    def process(self, required_workers):
+    def process(self, required_workers, **map_kwargs):
         """
         Fetches process executor mapper from the underlying
         :py:class:`ExecutorPool`.
@@ -233,8 +518,167 @@ class PoolOfPools(object):
                                      It can be ``None`` then
                                      :py:meth:`ExecutorPool.get_any` would be
                                      executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
+        """
+        return self.get_from_pool(self.processes, required_workers,
+                                  **map_kwargs)
+
+    def light(self, required_workers, **map_kwargs):
+        """
+        Fetches light thread executor mapper from the underlying
+        :py:class:`ExecutorPool`.
+
+        :param int required_workers: The amount of workers you are requiring.
+                                     It can be ``None`` then
+                                     :py:meth:`ExecutorPool.get_any` would be
+                                     executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
+        """
+        return self.get_from_pool(self.lights, required_workers,
+                                  **map_kwargs)
+
+    def interpreter(self, required_workers, **map_kwargs):
+        """
+        Fetches CPU bound executor mapper (sub-interpreters, threads on
+        free-threaded builds or processes) from the underlying
+        :py:class:`ExecutorPool`.
+
+        :param int required_workers: The amount of workers you are requiring.
+                                     It can be ``None`` then
+                                     :py:meth:`ExecutorPool.get_any` would be
+                                     executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
+        """
+        return self.get_from_pool(self.interpreters, required_workers,
+                                  **map_kwargs)
+
+    def connect(self, addresses):
+        """
+        Sets worker daemons (:py:class:`streams.executors.remote.WorkerServer`)
+        for the remote executors. After that ``remote`` keyword can be used.
+
+        :param list addresses: The list of ``host:port`` strings or
+                               ``(host, port)`` tuples.
+
+        >>> Stream.WORKERS.connect(["node1:9000", "node2:9000"])
+        >>> Stream(urls).map(heavy_function, remote=16)
         """
-        return self.get_from_pool(self.processes, required_workers)
+        self.remotes = ExecutorPool(RemoteExecutor, self.limit,
+                                    addresses=addresses)
+        self.remote_count = len(addresses)
+
+    def remote(self, required_workers, **map_kwargs):
+        """
+        Fetches remote executor mapper from the underlying
+        :py:class:`ExecutorPool`.
+
+        :param int required_workers: The amount of workers you are requiring.
+                                     It can be ``None`` then
+                                     :py:meth:`ExecutorPool.get_any` would be
+                                     executed.
+        :param dict map_kwargs:      Additional keyword arguments for the
+                                     mapper.
+        """
+        if self.remotes is None:
+            raise ValueError("Please connect to worker daemons first")
+        return self.get_from_pool(self.remotes, required_workers,
+                                  **map_kwargs)
+
+    # noinspection PyBroadException
+    @staticmethod
+    def profile(predicate, sample):
+        """
+        Executes ``predicate`` on the ``sample`` serially measuring wall
+        time, CPU time of the thread and the cost of pickling of arguments and
+        results (what processes would pay).
+
+        Returns the tuple of results and 3 timings. CPU time is ``None`` if
+        :py:func:`time.thread_time` is not available (Python 2).
+
+        :param Callable predicate: The function to profile.
+        :param list sample: The elements to apply ``predicate`` to.
+        """
+        results, wall_time = [], 0.0
+        cpu_time = None if thread_time is None else 0.0
+        for item in sample:
+            started_at = time()
+            if cpu_time is None:
+                results.append(predicate(item))
+            else:
+                cpu_started_at = thread_time()
+                results.append(predicate(item))
+                cpu_time += thread_time() - cpu_started_at
+            wall_time += time() - started_at
+
+        started_at = time()
+        try:
+            for item, result in zip(sample, results):
+                pickle.dumps((predicate, item), pickle.HIGHEST_PROTOCOL)
+                pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            pickle_time = float("inf")
+        else:
+            pickle_time = time() - started_at
+
+        return results, wall_time, cpu_time, pickle_time
+
+    def decide(self, wall_time, cpu_time, pickle_time, size):
+        """
+        Chooses the concurrency by the timings of :py:meth:`profile`.
+        Returns ``"serial"``, ``"parallel"`` or ``"interpreters"``.
+
+        .. note::
+            If ``cpu_time`` is ``None``, IO waits cannot be told from
+            computations so the decision is made by wall time only: processes
+            are chosen if pickling is cheap comparing to the work itself
+            (see :py:attr:`AUTO_PICKLE_RATIO`), threads otherwise.
+        """
+        if wall_time < self.AUTO_MIN_DURATION * size:
+            return "serial"
+        if cpu_time is None:
+            if self.default_count > 1 and \
+                    pickle_time < wall_time * self.AUTO_PICKLE_RATIO:
+                return "interpreters"
+            return "parallel"
+        if cpu_time < wall_time * self.AUTO_CPU_RATIO:
+            return "parallel"
+        if self.default_count > 1 and pickle_time * 2 < cpu_time:
+            return "interpreters"
+        return "serial"
+
+    def auto_map(self, predicate, iterable, **map_kwargs):
+        """
+        Mapper for ``concurrency="auto"``. It profiles first elements (see
+        :py:meth:`profile`), chooses the concurrency (see :py:meth:`decide`)
+        and maps the rest of ``iterable`` with it. Decision is logged with
+        ``INFO`` level.
+
+        :param Callable predicate: The function to map.
+        :param Iterable iterable: The elements to map.
+        :param dict map_kwargs: Additional keyword arguments for the mapper.
+        """
+        iterator = iter(iterable)
+        sample = list(islice(iterator, self.AUTO_SAMPLE_SIZE))
+        results, wall_time, cpu_time, pickle_time = self.profile(predicate,
+                                                                 sample)
+        decision = self.decide(wall_time, cpu_time, pickle_time, len(sample))
+        LOG.info("Concurrency %s is chosen for %r: %d elements took %.6fs, "
+                 "CPU %s, pickling %.6fs", decision, predicate,
+                 len(sample), wall_time,
+                 "n/a" if cpu_time is None else "%.6fs" % cpu_time,
+                 pickle_time)
+
+        for result in results:
+            yield result
+        if decision == "serial":
+            mapper = imap
+        else:
+            mapper = self.get(dict(map_kwargs, **{decision: True}))
+        for result in mapper(predicate, iterator):
+            yield result
 
     def get(self, kwargs):
         """
@@ -244,16 +688,47 @@ class PoolOfPools(object):
                             :py:meth:`streams.Stream.map` documentation
                             to understand what this dict has to have.
         """
+        workers = kwargs.get("workers")
+        if workers is not None and workers is not self:
+            return workers.get(kwargs)
+
+        map_kwargs = dict((name, kwargs[name])
+                          for name in self.MAP_KWARGS if name in kwargs)
+
+        if kwargs.get("concurrency") == "auto":
+            return partial(self.auto_map, **map_kwargs)
+
         if "parallel" in kwargs:
             parallel = kwargs["parallel"]
             if parallel in (1, True):
-                return self.parallel(self.default_count)
+                return self.parallel(self.default_count, **map_kwargs)
             if parallel is not None:
-                return self.parallel(parallel)
+                return self.parallel(parallel, **map_kwargs)
 
         if "process" in kwargs:
             process = kwargs["process"]
             if process in (1, True):
-                return self.process(self.default_count)
+                return self.process(self.default_count, **map_kwargs)
             if process is not None:
-                return self.process(process)
+                return self.process(process, **map_kwargs)
+
+        if "interpreters" in kwargs:
+            interpreters = kwargs["interpreters"]
+            if interpreters in (1, True):
+                return self.interpreter(self.default_count, **map_kwargs)
+            if interpreters is not None:
+                return self.interpreter(interpreters, **map_kwargs)
+
+        if "remote" in kwargs:
+            remote = kwargs["remote"]
+            if remote in (1, True):
+                return self.remote(self.remote_count, **map_kwargs)
+            if remote is not None:
+                return self.remote(remote, **map_kwargs)
+
+        if "light" in kwargs:
+            light = kwargs["light"]
+            if light in (1, True):
+                return self.light(self.default_count, **map_kwargs)
+            if light is not None:
+                return self.light(light, **map_kwargs)
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains storages which help Streams to keep big amounts of
+data out of the memory and to write them to the disk. Basically they are
+used internally by :py:class:`streams.Stream` methods which may need to spill
+data to the disk.
+"""
+
+
+###############################################################################
+
+
+from array import array
+from collections import deque
+from hashlib import sha1
+from inspect import ismethod
+from itertools import chain
+from os import SEEK_END
+# noinspection PyUnresolvedReferences
+from six.moves import cPickle as pickle
+
+
+###############################################################################
+
+
+def rotated_path(path, index):
+    """
+    Returns the name of the file with given ``index`` for rotation. If
+    ``path`` has ``{0}`` placeholder, index is substituted there (other
+    braces are kept as is). Otherwise index is appended as a suffix (first
+    file has no suffix).
+
+    >>> rotated_path("out.log", 0)
+    ... 'out.log'
+    >>> rotated_path("out.log", 2)
+    ... 'out.log.2'
+    >>> rotated_path("out-{0}.log", 2)
+    ... 'out-2.log'
+    >>> rotated_path("{date}-{0}.log", 2)
+    ... '{date}-2.log'
+    """
+    if "{0}" in path:
+        return path.replace("{0}", str(index))
+    if not index:
+        return path
+    return "{0}.{1}".format(path, index)
+
+
+def write_blocks(path, blocks, max_size=None, header=b""):
+    """
+    Writes blocks of bytes into the file rotating it if it exceeds
+    ``max_size`` bytes. Every file starts with ``header``. Blocks are never
+    split between files.
+
+    :param str path: The path to the file. Please checkout
+                     :py:func:`rotated_path` on naming of rotated files.
+    :param Iterable blocks: Blocks of data to write.
+    :param int max_size: The maximal size of the file. ``None`` means that
+                         file is never rotated.
+    :param bytes header: Data to write into the beginning of every file.
+    :return: :py:func:`list` of written paths.
+    """
+    paths = [rotated_path(path, 0)]
+    file_handler = open(paths[-1], "wb")
+    try:
+        file_handler.write(header)
+        size = len(header)
+        for block in blocks:
+            if max_size is not None and size > len(header) and \
+                    size + len(block) > max_size:
+                file_handler.close()
+                paths.append(rotated_path(path, len(paths)))
+                file_handler = open(paths[-1], "wb")
+                file_handler.write(header)
+                size = len(header)
+            file_handler.write(block)
+            size += len(block)
+    finally:
+        file_handler.close()
+    return paths
+
+
+class PickleLog(object):
+    """
+    Append only log of pickled items stored in the temporary file. Items
+    are iterated in the order they were appended. The file is removed when
+    log is closed or garbage collected.
+
+    >>> log = PickleLog()
+    >>> log.append(1)
+    >>> log.extend([2, 3])
+    >>> list(log)
+    ... [1, 2, 3]
+    """
+
+    READ_BATCH = 1024
+
+    def __init__(self, directory=None):
+        """
+        Constructor of the class.
+
+        :param str directory: The directory for the temporary file. If not
+                              set, default one from :py:mod:`tempfile` would
+                              be used.
+        """
+        from tempfile import TemporaryFile
+
+        self.file = TemporaryFile(dir=directory)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        offset, index = 0, 0
+        while index < self.length:
+            self.file.flush()
+            self.file.seek(offset)
+            batch = []
+            while index < self.length and len(batch) < self.READ_BATCH:
+                batch.append(pickle.load(self.file))
+                index += 1
+            offset = self.file.tell()
+            self.file.seek(0, SEEK_END)
+            for item in batch:
+                yield item
+
+    def append(self, item):
+        """
+        Appends ``item`` to the end of the log.
+        """
+        pickle.dump(item, self.file, pickle.HIGHEST_PROTOCOL)
+        self.length += 1
+
+    def extend(self, iterable):
+        """
+        Appends all items from ``iterable`` to the end of the log.
+        """
+        for item in iterable:
+            self.append(item)
+
+    def close(self):
+        """
+        Closes the log and removes its file.
+        """
+        self.file.close()
+
+
+class SpillCache(object):
+    """
+    Cache of :py:class:`streams.Stream` which keeps up to ``memory_limit``
+    items in the memory and spills the rest to the disk
+    (:py:class:`PickleLog`). Items are iterated in the order they were
+    appended.
+    """
+
+    def __init__(self, memory_limit, directory=None):
+        """
+        Constructor of the class.
+
+        :param int memory_limit: The maximal number of items to keep in the
+                                 memory.
+        :param str directory: The directory for the temporary file.
+        """
+        assert memory_limit >= 0
+
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self.items = deque()
+        self.log = None
+
+    def __len__(self):
+        return len(self.items) + (len(self.log) if self.log else 0)
+
+    def __iter__(self):
+        if self.log is None:
+            return iter(self.items)
+        return chain(self.items, self.log)
+
+    def append(self, item):
+        """
+        Appends ``item`` to the cache.
+        """
+        if self.log is None and len(self.items) < self.memory_limit:
+            self.items.append(item)
+            return
+        if self.log is None:
+            self.log = PickleLog(self.directory)
+        self.log.append(item)
+
+
+class ArrayCache(object):
+    """
+    Cache of :py:class:`streams.Stream` which keeps homogeneous numbers in
+    compact :py:class:`array.array` instead of the list of Python objects.
+    """
+
+    def __init__(self, typecode):
+        """
+        Constructor of the class.
+
+        :param str typecode: Type code of :py:class:`array.array` (``l`` for
+                             integers, ``d`` for floats etc).
+        """
+        self.items = array(typecode)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, item):
+        """
+        Appends ``item`` to the cache.
+        """
+        self.items.append(item)
+
+
+class Memoizer(object):
+    """
+    Cache of the results of pure function for :py:meth:`streams.Stream.map`.
+    It has 2 tiers: bounded in-memory LRU cache and optional persistent one
+    (:py:mod:`shelve` file keyed by SHA1 of pickled qualified name of the
+    function and its argument) which survives between runs. Results are
+    keyed by function so one memoizer may be shared between several
+    functions. Results of lambdas, closures and bound methods are kept in
+    memory only: their names do not identify them.
+
+    It counts hits and misses so you can check if memoization makes sense.
+
+    >>> memoizer = Memoizer(1000, "/tmp/normalized_urls")
+    >>> stream = Stream(urls).map(normalize, memoize=memoizer, process=4)
+    >>> memoizer.hits, memoizer.misses
+    ... (9000, 1000)
+    """
+
+    MISSING = object()
+
+    def __init__(self, size=1024, path=None):
+        """
+        Constructor of the class.
+
+        :param int size: The size of in-memory LRU cache.
+        :param str path: The path to the persistent cache. If ``None``,
+                         there is no persistent tier.
+        """
+        assert size > 0
+
+        from repoze.lru import LRUCache
+        from shelve import open as shelve_open
+
+        self.memory = LRUCache(size)
+        self.persistent = None if path is None else shelve_open(path)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def function_name(function):
+        """
+        Returns qualified name of the ``function`` (module and name) which
+        identifies it between runs or ``None`` if name is not enough:
+        lambdas, closures, bound methods and callables without name (e.g.
+        partials). Results of such functions are not persisted.
+        """
+        name = getattr(function, "__qualname__", None) or \
+            getattr(function, "__name__", None)
+        if name is None or "<lambda>" in name or ismethod(function) or \
+                getattr(function, "__closure__", None):
+            return None
+        return "{0}.{1}".format(getattr(function, "__module__", ""), name)
+
+    @staticmethod
+    def digest(item):
+        """
+        Returns SHA1 of pickled ``item``.
+        """
+        return sha1(pickle.dumps(item, 2)).hexdigest()
+
+    @staticmethod
+    def key(function, item):
+        """
+        Returns the key of in-memory cache for the ``item`` mapped by
+        ``function``: the function itself (so functions of the same name
+        never share results), type of the item and item itself if it is
+        hashable (so equal ``1``, ``1.0`` and ``True`` are different keys),
+        its digest otherwise.
+        """
+        try:
+            hash(item)
+        except TypeError:
+            return function, Memoizer.digest(item)
+        return function, type(item), item
+
+    def persistent_key(self, function, item):
+        """
+        Returns the key of persistent cache for the ``item`` mapped by
+        ``function`` or ``None`` if it should not be persisted.
+        """
+        if self.persistent is None:
+            return None
+        name = self.function_name(function)
+        if name is None:
+            return None
+        return self.digest((name, item))
+
+    def lookup(self, function, item):
+        """
+        Returns the tuple of (``found``, ``result``) for the ``item`` mapped
+        by ``function``.
+        """
+        key = self.key(function, item)
+        result = self.memory.get(key, self.MISSING)
+        if result is self.MISSING:
+            persistent_key = self.persistent_key(function, item)
+            if persistent_key is not None:
+                result = self.persistent.get(persistent_key, self.MISSING)
+            if result is not self.MISSING:
+                self.memory.put(key, result)
+        if result is self.MISSING:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, result
+
+    def store(self, function, item, result):
+        """
+        Stores the ``result`` for the ``item`` mapped by ``function`` in all
+        tiers.
+        """
+        self.memory.put(self.key(function, item), result)
+        persistent_key = self.persistent_key(function, item)
+        if persistent_key is not None:
+            self.persistent[persistent_key] = result
+
+    def close(self):
+        """
+        Closes persistent tier.
+        """
+        if self.persistent is not None:
+            self.persistent.close()
+            self.persistent = None
@@ -10,10 +10,13 @@ This module contains the definition of Stream class.
 from __future__ import division
 
 from collections import Iterable, Sized, deque
+from contextlib import contextmanager
+from functools import partial
 from heapq import nlargest, nsmallest, heappush, heappop
 from itertools import chain, islice, repeat
 from operator import add, truediv
 from re import compile as regex_compile
+from threading import local
 
 from six import iteritems, advance_iterator
 
@@ -21,11 +24,23 @@ from six import iteritems, advance_iterator
 from six.moves import filter as ifilter, map as imap, reduce as reduce_func, \
     xrange as xxrange
 
-from .iterators import seed, distinct, peek, accumulate, partly_distinct
-from .poolofpools import PoolOfPools
+from .iterators import seed, distinct, peek, accumulate, partly_distinct, \
+    tee, TeeBuffer, window, time_window, session_window, rolling, hash_join, \
+    merge_join, mmap_lines, read_lines, batch, prefetch, memoized_map
+from .storage import write_blocks, SpillCache, ArrayCache, Memoizer
 from .utils import MaxHeapItem, filter_true, filter_false, value_mapper, \
     key_mapper, filter_keys, filter_values, make_list, int_or_none, \
-    float_or_none, long_or_none, decimal_or_none, unicode_or_none
+    float_or_none, long_or_none, decimal_or_none, unicode_or_none, \
+    apply_to_branch, RollingAverage, key_value, length_hint, split_file, \
+    parse_file_range, parse_jsonl_range, parse_csv_lines, parse_csv_range, \
+    serialize_lines, serialize_json, serialize_csv, compress_block, \
+    encode_block, apply_bulk, LazyPoolOfPools
+
+
+###############################################################################
+
+
+PIPELINE = local()
 
 
 ###############################################################################
@@ -37,9 +52,11 @@ class Stream(Iterable, Sized):
     checkout member documentation to get an examples.
     """
 
-    WORKERS = PoolOfPools()
+    WORKERS = LazyPoolOfPools()
     SENTINEL = object()
     ALL = object()
+    CHUNK_SIZE = 16 * 1024 * 1024
+    BATCH_SIZE = 10000
 
     @classmethod
     def concat(cls, *streams):
@@ -113,7 +130,174 @@ class Stream(Iterable, Sized):
         """
         return cls(xxrange(*args, **kwargs))
 
-    def __init__(self, iterator, max_cache=0):
+    @classmethod
+    @contextmanager
+    def pipeline(cls, queue_size=16):
+        """
+        Context manager which enables pipeline execution mode for the streams
+        iterated within it (in the current thread). In this mode every stage
+        of the stream (every :py:class:`Stream` instance in the chain) runs
+        in its own thread (greenlet if monkey patched by Gevent) and passes
+        elements to the next stage through the bounded queue. So stages work
+        simultaneously and fast stage is blocked if the next one can't keep
+        up with it.
+
+        :param int queue_size: The size of the queue between stages.
+
+        >>> stream = Stream(urls).map(fetch).exclude_nones().map(parse)
+        >>> with Stream.pipeline(32):
+        ...     pages = stream.count()
+
+        .. note::
+            Please be noticed that :py:class:`Stream` is lazy so mode is
+            selected by the place where terminal operation is executed, not
+            where stream is built.
+        """
+        assert queue_size > 0
+
+        previous = getattr(PIPELINE, "queue_size", None)
+        PIPELINE.queue_size = queue_size
+        try:
+            yield
+        finally:
+            PIPELINE.queue_size = previous
+
+    @classmethod
+    def from_file(cls, path, mmap=True, parser=None, chunk_size=CHUNK_SIZE,
+                  **concurrency_kwargs):
+        """
+        Creates a stream of lines of the file (without line separators).
+
+        If ``mmap`` is ``True``, file is memory mapped and lines are
+        :py:class:`memoryview` slices of the mapping, so no data is copied.
+        Otherwise file is read as usual and lines are :py:class:`bytes`.
+
+        If concurrency keywords are set (the same as for
+        :py:meth:`Stream.map`), file is split into byte ranges of
+        ``chunk_size`` aligned to line separators and every range is read and
+        parsed by concurrent worker. This is the way to utilize multiple
+        cores on ingestion of huge files (use ``process`` keyword then).
+
+        :param str path: The path to the file.
+        :param bool mmap: Memory map the file or not.
+        :param function parser: The function to apply to every line. It gets
+                                :py:class:`memoryview` in memory mapped
+                                sequential mode and :py:class:`bytes`
+                                otherwise. With ``process`` concurrency it
+                                has to be pickleable.
+        :param int chunk_size: The size of byte range for concurrent workers.
+        :param dict concurrency_kwargs: The same concurrency keywords as for
+                                        :py:meth:`Stream.map`.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.from_file("access.log")
+        >>> stream = stream.map(bytes).limit(1)
+        >>> list(stream)
+        ... [b'127.0.0.1 - - [01/Feb/2015:10:00:00] "GET / HTTP/1.1" 200']
+        >>> stream = Stream.from_file("numbers.txt", parser=int, process=8)
+        >>> stream.sum()
+        ... 500000500000
+
+        .. note::
+            Concurrent mode yields :py:class:`bytes` (or parsed lines) since
+            :py:class:`memoryview` can't be shared between workers.
+        """
+        mapper = cls.WORKERS.get(concurrency_kwargs)
+        if mapper:
+            ranges = ((path, start, end, parser)
+                      for start, end in split_file(path, chunk_size))
+            return cls(mapper(parse_file_range, ranges)).chain()
+        if mmap:
+            lines = mmap_lines(path)
+        else:
+            lines = read_lines(path)
+        if parser is not None:
+            lines = imap(parser, lines)
+        return cls(lines)
+
+    @classmethod
+    def read_jsonl(cls, path, columns=None, chunk_size=CHUNK_SIZE,
+                   **concurrency_kwargs):
+        """
+        Creates a stream of records from `JSON Lines <http://jsonlines.org>`_
+        file. File is split into byte ranges of ``chunk_size`` and every
+        range is parsed as a whole by concurrent worker (if concurrency
+        keywords are set) so records are not shipped to workers line by line.
+        Records are yielded in the order of the file.
+
+        :param str path: The path to the file.
+        :param list columns: If set, only these keys are kept in records.
+                             It reduces the amount of data to return from
+                             workers.
+        :param int chunk_size: The size of byte range for workers.
+        :param dict concurrency_kwargs: The same concurrency keywords as for
+                                        :py:meth:`Stream.map`.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.read_jsonl("events.jsonl", columns=["id"],
+        ...                            process=8)
+        >>> list(stream.limit(2))
+        ... [{'id': 1}, {'id': 2}]
+        """
+        ranges = ((path, start, end, columns)
+                  for start, end in split_file(path, chunk_size))
+        mapper = cls.WORKERS.get(concurrency_kwargs) or imap
+        return cls(mapper(parse_jsonl_range, ranges)).chain()
+
+    @classmethod
+    def read_csv(cls, path, columns=None, header=True, encoding="utf-8",
+                 delimiter=",", chunk_size=CHUNK_SIZE, **concurrency_kwargs):
+        """
+        Creates a stream of records from CSV file. The same as
+        :py:meth:`Stream.read_jsonl` it parses file by big byte ranges in
+        concurrent workers and yields records in the order of the file.
+
+        :param str path: The path to the file.
+        :param list columns: If set, only these fields are built for records.
+                             They are names of the columns if file has a
+                             header or indexes otherwise.
+        :param bool header: If ``True``, first line is treated as a header
+                            and records are :py:class:`dict` instances.
+                            Otherwise records are lists.
+        :param str encoding: The encoding of the file.
+        :param str delimiter: The delimiter of the fields.
+        :param int chunk_size: The size of byte range for workers.
+        :param dict concurrency_kwargs: The same concurrency keywords as for
+                                        :py:meth:`Stream.map`.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.read_csv("books.csv", columns=["name"],
+        ...                          process=8)
+        >>> list(stream.limit(1))
+        ... [{'name': 'Dune'}]
+
+        .. note::
+            Quoted fields with line separators are not supported since file
+            is split by lines.
+        """
+        names, indexes, offset = None, columns, 0
+        fmtparams = {"delimiter": delimiter}
+        if header:
+            with open(path, "rb") as file_handler:
+                first_line = file_handler.readline()
+            offset = len(first_line)
+            # the header is parsed as data rows are, so names and values are
+            # the same text type on Python 2 too
+            first_line = first_line.rstrip(b"\n")
+            if first_line[-1:] == b"\r":
+                first_line = first_line[:-1]
+            names = next(parse_csv_lines([first_line], encoding, fmtparams),
+                         [])
+            if columns is not None:
+                indexes = [names.index(column) for column in columns]
+                names = list(columns)
+
+        ranges = ((path, start, end, names, indexes, encoding, fmtparams)
+                  for start, end in split_file(path, chunk_size, offset))
+        mapper = cls.WORKERS.get(concurrency_kwargs) or imap
+        return cls(mapper(parse_csv_range, ranges)).chain()
+
+    def __init__(self, iterator, max_cache=0, spill=None, typecode=None):
         """
         Initializes the :py:class:`Stream`.
 
@@ -126,10 +310,18 @@ class Stream(Iterable, Sized):
                                   :py:class:`Stream`.
         :param int max_cache: the number of items to cache (defaults to
                               ``Stream.ALL``).
+        :param int spill: Please checkout :py:meth:`Stream.cache`.
+        :param str typecode: Please checkout :py:meth:`Stream.cache`.
         """
         self._max_cache = max_cache
         if max_cache == 0:
             self._cache = None
+        elif spill is not None:
+            assert max_cache is self.ALL
+            self._cache = SpillCache(spill)
+        elif typecode is not None:
+            assert max_cache is self.ALL
+            self._cache = ArrayCache(typecode)
         else:
             max_cache = None if max_cache is self.ALL else max_cache
             self._cache = deque(maxlen=max_cache)
@@ -149,6 +341,12 @@ class Stream(Iterable, Sized):
         """
         To support iteration protocol.
         """
+        queue_size = getattr(PIPELINE, "queue_size", None)
+        if queue_size:
+            for item in prefetch(self._pipelined(queue_size), queue_size):
+                yield item
+            return
+
         cache = self._cache
         iterator = self.iterator
         if cache is None:
@@ -161,6 +359,24 @@ class Stream(Iterable, Sized):
                 cache.append(item)
                 yield item
 
+    def _pipelined(self, queue_size):
+        """
+        Iterates the stream in pipeline mode. It is executed in the
+        background thread so it has to enable pipeline mode there to run
+        upstream in its own thread also.
+
+        Internal method you do not want to use generally.
+        """
+        PIPELINE.queue_size = queue_size
+        cache = self._cache
+        if cache is not None:
+            for item in cache:
+                yield item
+        for item in self.iterator:
+            if cache is not None:
+                cache.append(item)
+            yield item
+
     def __reversed__(self):
         """
         To support :py:func:`reversed` iterator.
@@ -184,15 +400,28 @@ class Stream(Iterable, Sized):
         self.iterator = chain([first_element], self.iterator)
         return first_element
 
-    def cache(self, max_cache=ALL):
+    def cache(self, max_cache=ALL, spill=None, typecode=None):
         """Return a stream which caches elements for future iteration.
 
         By default the new stream will cache all elements. If passing an
         integer to ``max_cache``, the new stream will cache up to that many of
         the most recently iterated elements.
 
+        If you need to cache all elements of the big stream, there are 2
+        more compact options. ``spill`` keeps only given number of elements
+        in the memory and appends the rest to the temporary file (elements
+        have to be pickleable). ``typecode`` keeps homogeneous numbers in
+        :py:class:`array.array` of given type code instead of the list of
+        Python objects.
+
         :param int max_cache: the number of items to cache (defaults to
                               ``Stream.ALL``).
+        :param int spill: The number of elements to keep in the memory, the
+                          rest are spilled to the disk. Works only with
+                          ``Stream.ALL``.
+        :param str typecode: Type code of :py:class:`array.array` (``l`` for
+                             integers, ``d`` for floats etc). Works only with
+                             ``Stream.ALL``.
         :return: new processed :py:class:`Stream` instance.
 
         >>> stream = Stream.range(10).cache()
@@ -205,9 +434,82 @@ class Stream(Iterable, Sized):
         ... [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
         >>> list(stream)
         ... [5, 6, 7, 8, 9]
+        >>> stream = Stream.range(10 ** 7).cache(spill=1000)
+        >>> stream.sum()
+        ... 49999995000000
+        >>> stream.sum()
+        ... 49999995000000
+        """
+        return self.__class__(self, max_cache=max_cache, spill=spill,
+                              typecode=typecode)
+
+    def fork(self, copies=2, max_lag=None):
+        """
+        Splits the stream into several independent branches which share one
+        pass over the underlying iterator. Unlike ``cache(Stream.ALL)``, items
+        are kept in memory only until every branch consumes them.
+
+        :param int copies: The number of branches.
+        :param int max_lag: The maximal number of items the fastest branch
+                            may be ahead of the slowest one. If the gap is
+                            reached, the fastest branch blocks until others
+                            catch up so consume branches concurrently in that
+                            case. ``None`` means no limit.
+        :return: :py:class:`tuple` of new :py:class:`Stream` instances.
+
+        >>> first, second = Stream.range(5).fork()
+        >>> list(first)
+        ... [0, 1, 2, 3, 4]
+        >>> list(second.map(lambda item: item * 10))
+        ... [0, 10, 20, 30, 40]
+        """
+        return tuple(self.__class__(branch)
+                     for branch in tee(self, copies, max_lag))
 
+    def aggregate(self, *functions, **kwargs):
         """
-        return self.__class__(self, max_cache=max_cache)
+        Runs several terminal operations on the single pass of the stream.
+        Each function gets its own branch of :py:meth:`Stream.fork` and
+        branches are consumed concurrently in parallel executor.
+
+        :param list functions: Functions which take a :py:class:`Stream` and
+                               return some result.
+        :param dict kwargs: Keyword arguments. ``max_lag`` (please checkout
+                            :py:meth:`Stream.fork`), defaults to 10000, and
+                            ``workers`` (:py:class:`PoolOfPools` to use)
+                            are supported.
+        :return: :py:class:`tuple` of the results in the same order as
+                 ``functions``.
+
+        >>> stream = Stream.range(10)
+        >>> stream.aggregate(Stream.sum, Stream.count, Stream.median)
+        ... (45, 10, 5)
+
+        .. note::
+            Every branch occupies a worker until the end so exactly
+            ``len(functions)`` workers are reserved (waiting for them if
+            limited ``workers`` are busy). If they can't be reserved (worker
+            threads and threads which hold workers never wait), functions
+            are applied one by one to branches without ``max_lag``: still
+            single pass but all items are buffered in memory.
+        """
+        from .poolofpools import WorkersUnavailable
+
+        if not functions:
+            return ()
+        max_lag = kwargs.get("max_lag", 10000)
+        workers = kwargs.get("workers") or self.WORKERS
+        buffer_ = TeeBuffer(self, len(functions), max_lag)
+        branches = [self.__class__(buffer_.branch(index))
+                    for index in range(len(functions))]
+        mapper = workers.parallel(len(functions), strict=True)
+        results = iter(mapper(apply_to_branch, functions, branches))
+        try:
+            first_result = advance_iterator(results)
+        except WorkersUnavailable:
+            buffer_.max_lag = None
+            return tuple(imap(apply_to_branch, functions, branches))
+        return (first_result,) + tuple(results)
 
     def _filter(self, condition, predicate, **concurrency_kwargs):
         """
@@ -509,7 +811,7 @@ class Stream(Iterable, Sized):
         """
         return self.__class__(tuple(repeat(item, clones)) for item in self)
 
-    def map(self, predicate, **concurrency_kwargs):
+    def map(self, predicate, memoize=None, **concurrency_kwargs):
         """
         The corner method of the :py:class:`Stream` and others are basing on
         it. It supports parallelization out of box. Actually it works just like
@@ -517,6 +819,12 @@ class Stream(Iterable, Sized):
 
         :param function predicate: Predicate to map each element of the
                                    :py:class:`Stream`.
+        :param memoize: Memoize results of pure ``predicate``. It can be
+                        ``True`` (LRU cache of default size), the size of
+                        LRU cache or :py:class:`streams.storage.Memoizer`
+                        instance (for persistent cache and hit/miss
+                        counters). Cache is looked up before dispatching to
+                        concurrent workers so it is shared among them.
         :param dict concurrency_kwargs: The same concurrency keywords.
         :return: new processed :py:class:`Stream` instance.
 
@@ -573,11 +881,140 @@ class Stream(Iterable, Sized):
 
         .. note::
             By default no concurrency is used.
+
+        By default the number of submitted tasks is the same as the number
+        of workers so workers may idle while you process the result or wait
+        for the slow element which is the first in order. Set
+        ``max_inflight`` keyword to keep more tasks submitted (results are
+        buffered to keep the order).
+
+        >>> stream.map(requests.get, parallel=4, max_inflight=32)
+
+        If you want to limit the time to wait for every element, set
+        ``timeout`` keyword (in seconds). It is counted since the element
+        became the first one in the order of results.
+        ``concurrent.futures.TimeoutError`` is raised if it is exceeded.
+
+        >>> stream.map(requests.get, parallel=64, timeout=10)
+
+        If ``predicate`` is idempotent but sometimes hangs (flaky backend),
+        you may set ``hedge`` keyword, the percentile of recent latencies
+        (e.g. ``0.95``). If the first element in the order runs longer,
+        duplicate task is submitted and the fastest result is taken.
+
+        >>> stream.map(requests.get, parallel=64, hedge=0.95)
+
+        If ``predicate`` is tiny (microseconds) the overhead of thread pool
+        dominates. Use ``light`` keyword then: it works like ``parallel``
+        but it sends elements to the workers by chunks of ``chunksize``
+        elements (64 by default) and has much cheaper bookkeeping.
+        ``hedge`` is not supported here, ``timeout`` and ``max_inflight``
+        are applied to chunks, not to elements.
+
+        >>> stream.map(int, light=4, chunksize=256)
+
+        For CPU bound ``predicate`` use ``interpreters`` keyword. It uses
+        sub-interpreters on Python 3.14+, threads on free-threaded builds
+        and processes otherwise. ``predicate`` has to be importable (not a
+        lambda) like for ``process``.
+
+        >>> stream.map(hashlib.sha256, interpreters=8)
+
+        If one box is not enough, start worker daemons
+        (:py:mod:`streams.executors.remote`) and use ``remote`` keyword.
+        Elements are sent by chunks of ``chunksize`` elements, tasks of the
+        lost daemon are resubmitted to another one.
+
+        >>> Stream.WORKERS.connect(["node1:9000", "node2:9000"])
+        >>> stream.map(hashlib.sha256, remote=16)
+
+        If you are not sure, set ``concurrency="auto"``. First elements
+        are processed serially and profiled: if they are too fast, the rest
+        is processed serially. If the CPU time is small comparing to the wall
+        time (IO), ``parallel`` is used. If ``predicate`` is CPU bound and
+        pickling is cheap, ``interpreters`` is used. The decision is logged
+        by ``streams.poolofpools`` logger.
+
+        >>> stream.map(requests.get, concurrency="auto")
+
+        If several streams share executors, tasks are served in the order of
+        submission. Set ``priority`` (bigger is served earlier, ``1``
+        overtakes tasks submitted up to 0.1 second earlier) or ``deadline``
+        (seconds the task should be started in, 1 by default) to let
+        interactive streams overtake background ones. Old tasks eventually
+        win anyway so nothing is starved. Supported by thread pools
+        (``parallel``, ``remote`` and ``interpreters`` on free-threaded
+        builds), other executors (``light``, ``process``, sub-interpreters
+        and gevent one) silently ignore these keywords.
+
+        >>> stream.map(requests.get, parallel=8, priority=10)
+        >>> stream.map(requests.get, parallel=8, deadline=0.05)
+
+        ``predicate`` may run concurrent streams itself (e.g. per-file map
+        inside of per-directory map). Worker threads waiting for the results
+        of inner stream execute its pending tasks themselves (work stealing)
+        and never wait for the limits of
+        :py:class:`streams.poolofpools.PoolOfPools` so it does not deadlock.
+        Stolen tasks are not hedged and inner streams with ``timeout`` do
+        not steal (their waiting is bounded anyway).
+
+        All concurrent executors are taken from :py:attr:`Stream.WORKERS` by
+        default. To isolate workloads, pass your own
+        :py:class:`streams.poolofpools.PoolOfPools` with ``workers`` keyword
+        (or use it as a context manager).
+
+        >>> batch_workers = PoolOfPools(max_workers=16)
+        >>> stream.map(requests.get, parallel=8, workers=batch_workers)
+
+        If you stop consuming the stream early (:py:meth:`Stream.limit`,
+        :py:meth:`Stream.any` etc), pending tasks are cancelled and workers
+        are returned to the pool.
+
+        Memoization works with any concurrency
+
+        >>> memoizer = Memoizer(10000, "/var/cache/geoip")
+        >>> stream.map(geoip_lookup, memoize=memoizer, parallel=16)
         """
         mapper = self.WORKERS.get(concurrency_kwargs)
         if not mapper:
             mapper = imap
-        return self.__class__(mapper(predicate, self))
+        if memoize is None or memoize is False:
+            return self.__class__(mapper(predicate, self))
+        if memoize is True:
+            memoize = Memoizer()
+        elif not isinstance(memoize, Memoizer):
+            memoize = Memoizer(memoize)
+        return self.__class__(memoized_map(mapper, predicate, self, memoize))
+
+    def map_batched(self, bulk_predicate, max_batch=100, max_wait=None,
+                    **concurrency_kwargs):
+        """
+        Maps elements of the stream with the bulk function: elements are
+        transparently coalesced into lists (checkout :py:meth:`Stream.batch`)
+        and ``bulk_predicate`` gets a list and has to return the list of
+        results in the same order. Batches are dispatched concurrently if
+        concurrency keywords are set. The order of elements is kept.
+
+        It is useful if your backend has bulk API: one request for 100
+        elements is much cheaper than 100 requests.
+
+        :param function bulk_predicate: Function which maps the list of
+                                        elements to the list of results.
+        :param int max_batch: The maximal size of the batch.
+        :param float max_wait: The maximal time to wait for a batch to be
+                               full (useful for slow sources).
+        :param dict concurrency_kwargs: The same concurrency keywords as for
+                                        :py:meth:`Stream.map`.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream(user_ids)
+        >>> stream = stream.map_batched(fetch_users, max_batch=50,
+        ...                             parallel=8)
+        """
+        mapper = self.WORKERS.get(concurrency_kwargs) or imap
+        batches = ((bulk_predicate, items)
+                   for items in batch(self, max_batch, max_wait))
+        return self.__class__(mapper(apply_bulk, batches)).chain()
 
     def _kv_map(self, mapper, predicate, **concurrency_kwargs):
         """
@@ -634,6 +1071,67 @@ class Stream(Iterable, Sized):
         """
         return self._kv_map(key_mapper, predicate, **concurrency_kwargs)
 
+    def join(self, other, key=None, how="inner", algorithm="hash",
+             memory_limit=None):
+        """
+        Joins the stream with ``other`` one by key. Elements are treated as
+        ``(key, value)`` pairs in the same way :py:meth:`Stream.keys` and
+        :py:meth:`Stream.values` do. If ``key`` is set, it is applied to
+        the element to get a key and element itself is a value. Result
+        elements are ``(key, (value, other_value))`` so it is possible to
+        continue with :py:meth:`Stream.value_map` etc.
+
+        :param Iterable other: The stream (or any iterable) to join with.
+        :param function key: The function to extract keys from elements of
+                             both streams.
+        :param str how: The type of join: ``inner``, ``left``, ``right`` or
+                        ``outer``. Missing values are ``None``.
+        :param str algorithm: ``hash`` or ``merge``. Hash join builds hash
+                              table on the smaller side (if both sides
+                              have known length, otherwise on ``other``
+                              side). Merge join requires both streams to be
+                              sorted by key and works in constant memory.
+        :param int memory_limit: The maximal number of elements (not bytes)
+                                 to keep in the hash table. If build side
+                                 has more elements, both sides are
+                                 partitioned to the disk. Ignored by merge
+                                 join.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> users = Stream([(1, "Alice"), (2, "Bob")])
+        >>> orders = Stream([(1, "book"), (1, "pen"), (3, "cup")])
+        >>> list(users.join(orders))
+        ... [(1, ("Alice", "book")), (1, ("Alice", "pen"))]
+        >>> users = Stream([(1, "Alice"), (2, "Bob")])
+        >>> orders = Stream([(1, "book"), (1, "pen"), (3, "cup")])
+        >>> list(users.join(orders, how="left", algorithm="merge"))
+        ... [(1, ("Alice", "book")), (1, ("Alice", "pen")), (2, ("Bob", None))]
+
+        .. note::
+            Please be noticed that hash join keeps whole build side in the
+            memory (unless ``memory_limit`` is set) and the order of the
+            results is not guaranteed if data was spilled to the disk.
+        """
+        assert algorithm in ("hash", "merge")
+
+        if not isinstance(other, Stream):
+            other = self.__class__(other)
+        if key is None:
+            left, right = imap(key_value, self), imap(key_value, other)
+        else:
+            left = ((key(item), item) for item in self)
+            right = ((key(item), item) for item in other)
+
+        if algorithm == "merge":
+            return self.__class__(merge_join(left, right, how))
+
+        self_length = length_hint(self.iterator)
+        other_length = length_hint(other.iterator)
+        build_left = self_length is not None and other_length is not None \
+            and self_length < other_length
+        return self.__class__(hash_join(left, right, how, build_left,
+                                        memory_limit))
+
     def distinct(self):
         """
         Removes duplicates from the stream.
@@ -710,6 +1208,22 @@ class Stream(Iterable, Sized):
         """
         return self.__class__(peek(self, predicate))
 
+    def prefetch(self, size=1):
+        """
+        Pulls elements of the stream in the background thread (greenlet if
+        monkey patched by Gevent) into the bounded queue. It makes sense if
+        the source is slow (network, decompression etc) and downstream
+        processing is heavy: they will work simultaneously instead of
+        strict alternation.
+
+        :param int size: The maximal number of prefetched elements.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream(urls).map(requests.get, parallel=8)
+        >>> stream = stream.prefetch(16).map(parse_page)
+        """
+        return self.__class__(prefetch(self, size))
+
     def limit(self, size):
         """
         Limits stream to given ``size``.
@@ -782,6 +1296,127 @@ class Stream(Iterable, Sized):
         """
         return self.__class__(chain.from_iterable(self))
 
+    def batch(self, size, max_wait=None):
+        """
+        Groups elements of the stream into lists of ``size`` elements (last
+        one may be shorter). If you want tuples, please checkout
+        :py:meth:`Stream.window`.
+
+        :param int size: The maximal number of elements in the list.
+        :param float max_wait: If set, list is yielded after ``max_wait``
+                               seconds since its first element arrived even
+                               if it is not full. Upstream is pulled in the
+                               background thread (greenlet if monkey patched
+                               by Gevent) in that case, so it works for slow
+                               unbounded sources also.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.range(5)
+        >>> stream = stream.batch(2)
+        >>> list(stream)
+        ... [[0, 1], [2, 3], [4]]
+        """
+        return self.__class__(batch(self, size, max_wait))
+
+    def unbatch(self):
+        """
+        Opposite to :py:meth:`Stream.batch`, flattens lists of elements.
+
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.range(5)
+        >>> stream = stream.batch(2).unbatch()
+        >>> list(stream)
+        ... [0, 1, 2, 3, 4]
+        """
+        return self.chain()
+
+    def window(self, size, step=None, partial=False):
+        """
+        Groups elements of the stream into windows (tuples) of ``size``
+        elements. If ``step`` is not set, windows are tumbling (do not
+        overlap), otherwise next window starts ``step`` elements after the
+        previous one.
+
+        :param int size: The size of the window.
+        :param int step: The step between windows.
+        :param bool partial: Yield last incomplete window or not.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.range(5)
+        >>> stream = stream.window(3, 1)
+        >>> list(stream)
+        ... [(0, 1, 2), (1, 2, 3), (2, 3, 4)]
+        """
+        return self.__class__(window(self, size, step, partial))
+
+    def time_window(self, size, timestamp, step=None):
+        """
+        Groups elements of the stream into time based windows (tuples).
+        Window contains elements with timestamps within
+        ``[start, start + size)``, starts are aligned to the multiples of
+        ``step`` (``size`` by default so windows are tumbling).
+
+        :param number size: The duration of the window.
+        :param function timestamp: Function which extracts numerical
+                                   timestamp from the element. Elements have
+                                   to be ordered by timestamp.
+        :param number step: The step between window starts.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream([1, 2, 5, 6, 11])
+        >>> stream = stream.time_window(5, lambda item: item)
+        >>> list(stream)
+        ... [(1, 2), (5, 6), (11,)]
+        """
+        return self.__class__(time_window(self, size, timestamp, step))
+
+    def session_window(self, gap, timestamp):
+        """
+        Groups elements of the stream into sessions (tuples). Session is
+        closed if the gap between timestamps of consecutive elements is
+        bigger than ``gap``.
+
+        :param number gap: Maximal inactivity gap within a session.
+        :param function timestamp: Function which extracts timestamp from the
+                                   element. Elements have to be ordered by
+                                   timestamp.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream([1, 2, 3, 10, 11, 20])
+        >>> stream = stream.session_window(2, lambda item: item)
+        >>> list(stream)
+        ... [(1, 2, 3), (10, 11), (20,)]
+        """
+        return self.__class__(session_window(self, gap, timestamp))
+
+    def rolling(self, size, aggregate=RollingAverage, timestamp=None):
+        """
+        Calculates rolling aggregate over the sliding window incrementally
+        so it takes O(1) per element regardless of the window size.
+
+        :param number size: The number of elements in the window or its
+                            duration if ``timestamp`` is set.
+        :param function aggregate: Factory of aggregate, checkout
+                                   :py:class:`streams.utils.RollingAggregate`
+                                   and its subclasses (``RollingCount``,
+                                   ``RollingSum``, ``RollingAverage``,
+                                   ``RollingMin``, ``RollingMax``).
+        :param function timestamp: Function which extracts timestamp from the
+                                   element. If set, window is time based.
+        :return: new processed :py:class:`Stream` instance.
+
+        >>> stream = Stream.range(5)
+        >>> stream = stream.rolling(2)
+        >>> list(stream)
+        ... [0.5, 1.5, 2.5, 3.5]
+
+        .. note::
+            Without ``timestamp`` aggregates are yielded only for full
+            windows, with ``timestamp`` - for each element.
+        """
+        return self.__class__(rolling(self, size, aggregate, timestamp))
+
     def largest(self, size):
         """
         Returns ``size`` largest elements from the stream.
@@ -984,3 +1619,104 @@ class Stream(Iterable, Sized):
         else:
             iterator = self.map(predicate, **concurrency_kwargs)
         return all(iterator)
+
+    def _write(self, path, serializer, header, batch_size, compression,
+               max_size, concurrency_kwargs):
+        """
+        Writes stream into the file(s) by blocks of ``batch_size`` elements.
+        Blocks are serialized and compressed concurrently.
+
+        Internal method you do not want to use generally.
+        """
+        mapper = self.WORKERS.get(concurrency_kwargs) or imap
+        blocks = ((serializer, compression, items)
+                  for items in window(self, batch_size, partial=True))
+        blocks = mapper(encode_block, blocks)
+        if header:
+            header = compress_block(compression, header)
+        return write_blocks(path, blocks, max_size, header)
+
+    def to_file(self, path, serializer=None, batch_size=BATCH_SIZE,
+                compression=None, max_size=None, **concurrency_kwargs):
+        """
+        Writes elements of the stream into the file line by line. Elements
+        are coalesced into blocks of ``batch_size`` so every block is
+        written with one system call. Serialization and compression of
+        blocks may be done concurrently (checkout concurrency keywords of
+        :py:meth:`Stream.map`), the order of elements is kept.
+
+        :param str path: The path to the file. If ``max_size`` is set and
+                         ``path`` has ``{0}`` placeholder, index of rotated
+                         file is formatted there. Otherwise index is
+                         appended as a suffix to every file except of the
+                         first one.
+        :param function serializer: Function to convert element into
+                                    :py:class:`bytes` or text (text is
+                                    encoded with UTF-8). By default
+                                    :py:class:`bytes` are written as is and
+                                    other elements are converted to text.
+        :param int batch_size: The number of elements in the block.
+        :param str compression: ``None``, ``gzip`` or ``zstd`` (requires
+                                :py:mod:`zstandard`). Every block is
+                                compressed as a separate frame, these frames
+                                form a valid compressed file.
+        :param int max_size: The maximal size of the file in bytes. If it is
+                             exceeded, next file is started. ``None`` means
+                             no rotation.
+        :param dict concurrency_kwargs: The same concurrency keywords as for
+                                        :py:meth:`Stream.map`.
+        :return: :py:func:`list` of written paths.
+
+        >>> stream = Stream.range(1000000)
+        >>> stream.to_file("numbers.txt.gz", compression="gzip", process=4)
+        ... ['numbers.txt.gz']
+        """
+        serializer = partial(serialize_lines, serializer)
+        return self._write(path, serializer, b"", batch_size, compression,
+                           max_size, concurrency_kwargs)
+
+    def to_jsonl(self, path, batch_size=BATCH_SIZE, compression=None,
+                 max_size=None, **concurrency_kwargs):
+        """
+        Writes elements of the stream into `JSON Lines
+        <http://jsonlines.org>`_ file. Please checkout
+        :py:meth:`Stream.to_file` for the meaning of parameters.
+
+        :return: :py:func:`list` of written paths.
+
+        >>> stream = Stream([{"id": 1}, {"id": 2}])
+        >>> stream.to_jsonl("events.jsonl")
+        ... ['events.jsonl']
+        """
+        serializer = partial(serialize_lines, serialize_json)
+        return self._write(path, serializer, b"", batch_size, compression,
+                           max_size, concurrency_kwargs)
+
+    def to_csv(self, path, columns=None, header=True, delimiter=",",
+               batch_size=BATCH_SIZE, compression=None, max_size=None,
+               **concurrency_kwargs):
+        """
+        Writes elements of the stream into CSV file (with UTF-8 encoding).
+        Please checkout :py:meth:`Stream.to_file` for the meaning of common
+        parameters.
+
+        :param list columns: If set, elements are treated as
+                             :py:class:`dict` instances and only these keys
+                             are written. Otherwise elements are sequences
+                             of fields.
+        :param bool header: Write ``columns`` as a header of every file or
+                            not.
+        :param str delimiter: The delimiter of the fields.
+        :return: :py:func:`list` of written paths.
+
+        >>> stream = Stream([{"id": 1, "name": "Dune"}])
+        >>> stream.to_csv("books.csv", columns=["id", "name"])
+        ... ['books.csv']
+        """
+        fmtparams = {"delimiter": delimiter}
+        serializer = partial(serialize_csv, fmtparams, columns)
+        header_line = b""
+        if header and columns is not None:
+            header_line = serialize_csv(fmtparams, None, [columns])
+        return self._write(path, serializer, header_line, batch_size,
+                           compression, max_size, concurrency_kwargs)
@@ -11,8 +11,16 @@ lambdas so we need for whole pickleable functions.
 
 ###############################################################################
 
-from six import PY3
-from six import text_type
+from collections import deque
+from csv import reader as csv_reader, writer as csv_writer, DictWriter
+from json import dumps as json_dumps, loads as json_loads
+from operator import add, sub, truediv
+from os.path import getsize
+from threading import Lock
+from zlib import compressobj, DEFLATED, MAX_WBITS
+
+from six import PY3, binary_type
+from six import StringIO, text_type
 # noinspection PyUnresolvedReferences
 from six.moves import zip as izip
 
@@ -20,6 +28,7 @@ try:
     from cdecimal import Decimal
 except ImportError:
     from decimal import Decimal
+from .iterators import mmap_lines
 
 if PY3:
     long = int
@@ -263,6 +272,307 @@ def value_mapper(argument):
     return apply_to_tuple(None, predicate, item=item)
 
 
+def key_value(item):
+    """
+    Makes ``(key, value)`` pair from the ``item`` in the same way as
+    :py:func:`filter_keys` and :py:func:`filter_values` treat it.
+
+    :param object item: It can be tuple, list or just an object.
+
+    >>> key_value((1, 2, 3))
+    ... (1, 3)
+    >>> key_value(1)
+    ... (1, 1)
+    """
+    return filter_keys(item), filter_values(item)
+
+
+# noinspection PyBroadException
+def length_hint(iterable):
+    """
+    Returns the length of ``iterable`` or its estimation (the same way as
+    :py:func:`operator.length_hint` does). Returns ``None`` if it is not
+    possible to guess.
+
+    :param Iterable iterable: Something iterable we need the length of.
+
+    >>> length_hint([1, 2, 3])
+    ... 3
+    >>> length_hint(iter(range(10)))
+    ... 10
+    >>> length_hint(item for item in range(10))
+    ... None
+    """
+    try:
+        return len(iterable)
+    except TypeError:
+        pass
+    try:
+        hint = iterable.__length_hint__()
+    except Exception:
+        return None
+    if hint is NotImplemented:
+        return None
+    return hint
+
+
+def split_file(path, chunk_size, offset=0):
+    """
+    Splits file into byte ranges of approximately ``chunk_size`` bytes.
+    Each range ends right after the line separator (or at the end of the
+    file) so ranges can be parsed independently.
+
+    :param str path: The path to the file.
+    :param int chunk_size: Desired size of the range in bytes.
+    :param int offset: The offset to start from.
+    :return: :py:func:`list` of ``(start, end)`` tuples.
+
+    >>> split_file("/var/log/syslog", 1024 * 1024)
+    ... [(0, 1048631), (1048631, 2097199), (2097199, 2302011)]
+    """
+    assert chunk_size > 0
+
+    size = getsize(path)
+    ranges = []
+    with open(path, "rb") as file_handler:
+        start = offset
+        while start < size:
+            file_handler.seek(min(start + chunk_size, size) - 1)
+            file_handler.readline()
+            end = min(file_handler.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_file_range(argument):
+    """
+    Parses lines of the file within given byte range. It is intended to be
+    executed within concurrent workers.
+
+    :param tuple argument: The tuple of (``path``, ``start``, ``end`` and
+                           ``parser``). ``parser`` is applied to every line
+                           (:py:class:`bytes` without line separator). If it
+                           is ``None``, lines are returned as is.
+    :return: :py:func:`list` of parsed lines.
+    """
+    path, start, end, parser = argument
+    lines = (bytes(line) for line in mmap_lines(path, start, end))
+    if parser is None:
+        return list(lines)
+    return [parser(line) for line in lines]
+
+
+def parse_jsonl_range(argument):
+    """
+    Parses JSON Lines within given byte range of the file. Empty lines are
+    skipped. It is intended to be executed within concurrent workers.
+
+    :param tuple argument: The tuple of (``path``, ``start``, ``end`` and
+                           ``columns``). If ``columns`` is not ``None``,
+                           only these keys are kept in the records.
+    :return: :py:func:`list` of parsed records.
+    """
+    path, start, end, columns = argument
+    records = []
+    for line in mmap_lines(path, start, end):
+        line = bytes(line).strip()
+        if not line:
+            continue
+        record = json_loads(line.decode("utf-8"))
+        if columns is not None:
+            record = dict((column, record.get(column)) for column in columns)
+        records.append(record)
+    return records
+
+
+def parse_csv_lines(lines, encoding, fmtparams):
+    """
+    Parses encoded CSV lines into rows of text cells.
+
+    :param Iterable lines: :py:class:`bytes` lines without line separators.
+    :param str encoding: The encoding of the lines.
+    :param dict fmtparams: Keyword arguments for :py:func:`csv.reader`.
+    :return: iterator of rows (lists of :py:class:`six.text_type`).
+    """
+    if PY3:
+        return csv_reader((line.decode(encoding) for line in lines),
+                          **fmtparams)
+    # csv module of Python 2 can't parse unicode
+    return ([cell.decode(encoding) for cell in row]
+            for row in csv_reader(lines, **fmtparams))
+
+
+def parse_csv_range(argument):
+    """
+    Parses CSV rows within given byte range of the file. Empty lines are
+    skipped. It is intended to be executed within concurrent workers.
+
+    :param tuple argument: The tuple of (``path``, ``start``, ``end``,
+                           ``names``, ``indexes``, ``encoding`` and
+                           ``fmtparams``). If ``indexes`` is not ``None``
+                           only these fields are taken from the row. If
+                           ``names`` is not ``None``, rows are converted
+                           into dicts with given keys. ``fmtparams`` go to
+                           :py:func:`csv.reader`.
+    :return: :py:func:`list` of parsed records.
+    """
+    path, start, end, names, indexes, encoding, fmtparams = argument
+    lines = (bytes(line) for line in mmap_lines(path, start, end))
+    records = []
+    for row in parse_csv_lines(lines, encoding, fmtparams):
+        if not row:
+            continue
+        if indexes is not None:
+            row = [row[index] for index in indexes]
+        if names is not None:
+            row = dict(izip(names, row))
+        records.append(row)
+    return records
+
+
+def to_bytes(item, encoding="utf-8"):
+    """
+    Converts ``item`` to :py:class:`bytes`. Text is encoded, other objects
+    are converted to text first.
+
+    :param object item: Item to convert.
+    :param str encoding: The encoding for the text.
+
+    >>> to_bytes(1)
+    ... b'1'
+    >>> to_bytes(u"1")
+    ... b'1'
+    """
+    if isinstance(item, binary_type):
+        return item
+    if not isinstance(item, text_type):
+        item = text_type(item)
+    return item.encode(encoding)
+
+
+def serialize_lines(serializer, items):
+    """
+    Serializes ``items`` into the block of lines.
+
+    :param function serializer: Function to apply to every item before
+                                conversion with :py:func:`to_bytes`. Can be
+                                ``None``.
+    :param list items: Items to serialize.
+    """
+    if serializer is not None:
+        items = (serializer(item) for item in items)
+    return b"".join(to_bytes(item) + b"\n" for item in items)
+
+
+def serialize_json(item):
+    """
+    Serializes ``item`` into compact JSON.
+
+    :param object item: Item to serialize.
+
+    >>> serialize_json({"a": 1})
+    ... '{"a":1}'
+    """
+    return json_dumps(item, separators=(",", ":"))
+
+
+def serialize_csv(fmtparams, columns, rows):
+    """
+    Serializes ``rows`` into the block of CSV lines encoded with UTF-8.
+
+    :param dict fmtparams: Formatting parameters for :py:func:`csv.writer`.
+    :param list columns: If set, rows are treated as :py:class:`dict`
+                         instances and only these keys are written.
+    :param list rows: Rows to serialize.
+
+    .. note::
+        :py:mod:`csv` module of Python 2 writes byte strings only so
+        unicode cells are encoded with UTF-8 before writing there.
+    """
+    if not PY3:
+        rows = [encode_csv_row(row) for row in rows]
+    buffer_ = StringIO()
+    if columns is None:
+        writer = csv_writer(buffer_, **fmtparams)
+    else:
+        writer = DictWriter(buffer_, columns, extrasaction="ignore",
+                            **fmtparams)
+    writer.writerows(rows)
+    data = buffer_.getvalue()
+    return data.encode("utf-8") if PY3 else data
+
+
+def encode_csv_row(row):
+    """
+    Encodes unicode cells of the row (:py:class:`dict` or sequence) with
+    UTF-8. Required for :py:mod:`csv` module of Python 2 only.
+    """
+    if isinstance(row, dict):
+        return dict((key, encode_csv_row([value])[0])
+                    for key, value in row.items())
+    return [cell.encode("utf-8") if isinstance(cell, text_type) else cell
+            for cell in row]
+
+
+def compress_block(compression, data):
+    """
+    Compresses the block of data as a separate compression frame so
+    compressed blocks can be concatenated.
+
+    :param str compression: ``None``, ``gzip`` or ``zstd`` (requires
+                            :py:mod:`zstandard` to be installed).
+    :param bytes data: Data to compress.
+    """
+    if compression is None:
+        return data
+    if compression == "gzip":
+        compressor = compressobj(6, DEFLATED, MAX_WBITS | 16)
+        return compressor.compress(data) + compressor.flush()
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard is required for zstd compression")
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError("Unknown compression {0}".format(compression))
+
+
+def encode_block(argument):
+    """
+    Serializes and compresses the block of items. It is intended to be
+    executed within concurrent workers.
+
+    :param tuple argument: The tuple of (``serializer``, ``compression`` and
+                           ``items``). ``serializer`` converts the list of
+                           items into :py:class:`bytes`, please checkout
+                           :py:func:`serialize_lines` and
+                           :py:func:`serialize_csv`.
+    """
+    serializer, compression, items = argument
+    return compress_block(compression, serializer(items))
+
+
+def apply_bulk(argument):
+    """
+    Applies bulk function to the list of items and checks that it returns
+    one result per item.
+
+    :param tuple argument: The tuple of (``function`` and ``items``).
+    :return: :py:func:`list` of results.
+
+    >>> apply_bulk((lambda items: [item * 2 for item in items], [1, 2]))
+    ... [2, 4]
+    """
+    function, items = argument
+    results = make_list(function(items))
+    if len(results) != len(items):
+        raise ValueError(
+            "Bulk function returned {0} results for {1} items".format(
+                len(results), len(items)))
+    return results
+
+
 def make_list(iterable):
     """
     Makes a list from given ``iterable``. But won't create new one if
@@ -276,6 +586,23 @@ def make_list(iterable):
     return list(iterable)
 
 
+def apply_to_branch(function, branch):
+    """
+    Applies ``function`` to the ``branch`` of forked :py:class:`Stream` and
+    closes the branch afterwards so it won't hold the shared buffer anymore
+    (see :py:func:`streams.iterators.tee`).
+
+    :param function function: Function to apply.
+    :param Stream branch: The branch of the forked stream.
+    """
+    try:
+        return function(branch)
+    finally:
+        close = getattr(branch.iterator, "close", None)
+        if close is not None:
+            close()
+
+
 ###############################################################################
 
 
@@ -333,3 +660,161 @@ class MaxHeapItem(object):
 
     def __nonzero__(self):
         return bool(self.value)
+
+
+class RollingAggregate(object):
+    """
+    Base class for incremental aggregates used by
+    :py:func:`streams.iterators.rolling`. Items are added when they enter
+    the window and evicted when they leave it (in the same order) so every
+    operation is O(1).
+    """
+
+    def add(self, item):
+        """
+        Adds ``item`` to the aggregate.
+        """
+        raise NotImplementedError
+
+    def evict(self, item):
+        """
+        Evicts ``item`` (the oldest one) from the aggregate.
+        """
+        raise NotImplementedError
+
+    def result(self):
+        """
+        Returns current value of the aggregate.
+        """
+        raise NotImplementedError
+
+
+class RollingCount(RollingAggregate):
+    """
+    Counts items within the window.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, item):
+        self.count += 1
+
+    def evict(self, item):
+        self.count -= 1
+
+    def result(self):
+        return self.count
+
+
+class RollingSum(RollingAggregate):
+    """
+    Sums items within the window.
+
+    .. note::
+        Floating point sums may accumulate rounding errors on long streams.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def add(self, item):
+        self.total = add(self.total, item)
+
+    def evict(self, item):
+        self.total = sub(self.total, item)
+
+    def result(self):
+        return self.total
+
+
+class RollingAverage(RollingSum):
+    """
+    Calculates the average of the items within the window.
+    """
+
+    def __init__(self):
+        super(RollingAverage, self).__init__()
+        self.count = 0
+
+    def add(self, item):
+        super(RollingAverage, self).add(item)
+        self.count += 1
+
+    def evict(self, item):
+        super(RollingAverage, self).evict(item)
+        self.count -= 1
+
+    def result(self):
+        if not self.count:
+            return None
+        return truediv(self.total, self.count)
+
+
+class RollingMax(RollingAggregate):
+    """
+    Tracks maximal item within the window using monotonic queue so
+    operations are amortized O(1).
+    """
+
+    def __init__(self):
+        self.candidates = deque()
+
+    def prefer(self, first, second):
+        """
+        Returns ``True`` if ``first`` should replace ``second`` as a
+        candidate.
+        """
+        return first > second
+
+    def add(self, item):
+        candidates = self.candidates
+        while candidates and self.prefer(item, candidates[-1]):
+            candidates.pop()
+        candidates.append(item)
+
+    def evict(self, item):
+        if self.candidates and self.candidates[0] == item:
+            self.candidates.popleft()
+
+    def result(self):
+        if self.candidates:
+            return self.candidates[0]
+
+
+class RollingMin(RollingMax):
+    """
+    Tracks minimal item within the window using monotonic queue so
+    operations are amortized O(1).
+    """
+
+    def prefer(self, first, second):
+        return first < second
+
+
+class LazyPoolOfPools(object):
+    """
+    Descriptor which creates :py:class:`streams.poolofpools.PoolOfPools` on
+    the first access. :py:mod:`concurrent.futures`, :py:mod:`multiprocessing`
+    and friends are imported only if concurrency is really used so
+    ``import streams`` is cheap.
+
+    Inside of ``with`` block of :py:class:`streams.poolofpools.PoolOfPools`
+    it returns that instance.
+    """
+
+    def __init__(self):
+        self.workers = None
+        self.lock = Lock()
+
+    def __get__(self, instance, owner):
+        from .poolofpools import PoolOfPools, scoped_workers
+
+        workers = scoped_workers()
+        if workers is not None:
+            return workers
+        if self.workers is None:
+            with self.lock:
+                if self.workers is None:
+                    self.workers = PoolOfPools()
+        return self.workers
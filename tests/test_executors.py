@@ -0,0 +1,636 @@
+# -*- coding: utf-8 -*-
+
+
+###############################################################################
+
+from collections import deque
+from logging import INFO, Handler, getLogger
+from socket import error as SocketError
+from threading import Event, Lock, Thread, Timer
+from time import sleep, time
+
+try:
+    from unittest2 import TestCase, skipIf
+except ImportError:
+    from unittest import TestCase, skipIf
+
+from concurrent.futures import CancelledError, TimeoutError, wait
+
+# noinspection PyUnresolvedReferences
+from six.moves import xrange
+# noinspection PyUnresolvedReferences
+from six.moves.queue import Empty
+
+from streams import Stream, poolofpools
+from streams.executors import ThreadPoolExecutor, LightThreadPoolExecutor, \
+    CPUExecutor, SequentalExecutor
+from streams.executors.executors import PriorityWorkQueue
+from streams.executors.mixins import LatencyTracker, is_worker_thread
+from streams.executors.remote import RemoteExecutor, WorkerServer
+from streams.poolofpools import ExecutorPool, PoolOfPools, WorkerLimit, \
+    WorkersUnavailable
+try:
+    from gevent import joinall, sleep as gevent_sleep
+    from streams.executors import GeventExecutor
+except ImportError:
+    GeventExecutor = None
+
+
+###############################################################################
+class ExecutorPoolTests(TestCase):
+    def test_capacity_is_released_on_early_close(self):
+        pool = ExecutorPool(ThreadPoolExecutor)
+        calls = []
+
+        def slow(item):
+            calls.append(item)
+            sleep(0.01)
+            return item
+
+        iterator = pool.get(4)(slow, xrange(1000))
+        self.assertEqual(next(iterator), 0)
+        iterator.close()
+        sleep(0.1)
+        self.assertListEqual(list(pool.workers), [4])
+        self.assertLessEqual(len(calls), 5)
+
+    def test_running_tasks_keep_workers_on_early_close(self):
+        pools = PoolOfPools(max_workers=2)
+        pool = pools.parallels
+        iterator = pool.get(2)(sleep, [0, 0.3, 0.3])
+        self.assertIsNone(next(iterator))
+        iterator.close()
+        self.assertListEqual(list(pool.workers), [])
+        self.assertFalse(pool.released.get(2))
+        self.assertEqual(pools.limit.available, 0)
+        sleep(0.4)
+        pool.collect()
+        self.assertListEqual(list(pool.workers), [2])
+        self.assertEqual(pools.limit.available, 2)
+
+    def test_capacity_is_released_on_error(self):
+        pool = ExecutorPool(ThreadPoolExecutor)
+        iterator = pool.get(2)(lambda item: 1 / item, [1, 0, 2, 3])
+        self.assertRaises(ZeroDivisionError, list, iterator)
+        self.assertListEqual(list(pool.workers), [2])
+
+    def test_best_fit(self):
+        pool = ExecutorPool(SequentalExecutor)
+        small, big = SequentalExecutor(), SequentalExecutor()
+        small._max_workers, big._max_workers = 10, 10
+        pool.worker_finished(big, 8)
+        pool.worker_finished(small, 3)
+
+        def start(required_workers):
+            iterator = iter(pool.get(required_workers)(abs, [-1, -2]))
+            self.assertEqual(next(iterator), 1)
+            return iterator
+
+        running = [start(2)]
+        self.assertEqual(dict(pool.workers), {1: [small], 8: [big]})
+        iterator = start(2)
+        self.assertEqual(dict(pool.workers), {1: [small], 6: [big]})
+
+        self.assertListEqual(list(iterator), [2])
+        self.assertEqual(dict(pool.workers), {1: [small], 8: [big]})
+        running.append(start(9))
+        self.assertEqual(dict(pool.workers), {1: [small], 8: [big]})
+
+    def test_idle_workers_are_squashed(self):
+        pool = ExecutorPool(ThreadPoolExecutor)
+        first, second = pool.get(2), pool.get(3)
+        self.assertListEqual(list(first(abs, [-1])), [1])
+        self.assertListEqual(list(second(abs, [-1])), [1])
+        workers = pool.workers
+        self.assertListEqual(list(workers), [5])
+        self.assertEqual(workers[5][0]._max_workers, 5)
+
+    def test_fast_path(self):
+        pool = ExecutorPool(ThreadPoolExecutor)
+        self.assertListEqual(list(pool.get(2)(abs, [-1])), [1])
+        executor = pool.released[2][0]
+        iterator = pool.get(2)(abs, [-1, -2])
+        self.assertEqual(next(iterator), 1)
+        self.assertEqual(len(pool.released[2]), 0)
+        self.assertListEqual(list(iterator), [2])
+        self.assertListEqual(list(pool.released[2]), [executor])
+        self.assertListEqual(pool.index, [])
+
+    def test_work_stealing(self):
+        for executor_class in (ThreadPoolExecutor, LightThreadPoolExecutor):
+            executor = executor_class(1)
+
+            def outer(items):
+                return list(executor.map(abs, items))
+
+            future = executor.submit(outer, xrange(-5, 0))
+            self.assertListEqual(future.result(5), [5, 4, 3, 2, 1])
+            self.assertTrue(executor.submit(is_worker_thread).result(5))
+            self.assertFalse(is_worker_thread())
+            executor.shutdown()
+
+    def test_priority(self):
+        executor = ThreadPoolExecutor(1)
+        started = Event()
+        executor.submit(started.wait)
+        order = []
+        futures = [executor.submit(order.append, "background")
+                   for _ in xrange(2)]
+        futures.append(
+            executor.submit_scheduled(10, None, order.append, "interactive"))
+        futures.append(
+            executor.submit_scheduled(0, 0, order.append, "deadline"))
+        started.set()
+        wait(futures)
+        self.assertListEqual(
+            order, ["interactive", "deadline", "background", "background"])
+        executor.shutdown()
+
+        pool = ExecutorPool(ThreadPoolExecutor)
+        mapper = pool.get(2, priority=1, deadline=0.1)
+        self.assertListEqual(list(mapper(abs, xrange(-5, 0))),
+                             [5, 4, 3, 2, 1])
+
+    def test_priority_aging(self):
+        queue = PriorityWorkQueue()
+        queue.local.key = queue.make_key() - 2
+        queue.put("old")
+        queue.local.key = queue.make_key(priority=10)
+        queue.put("urgent")
+        queue.local.key = None
+        queue.put(None)
+        queue.put("new")
+        self.assertListEqual([queue.get() for _ in xrange(4)],
+                             ["old", "urgent", "new", None])
+        self.assertRaises(Empty, queue.get_nowait)
+        self.assertRaises(Empty, queue.get, True, 0.01)
+
+    def test_max_inflight(self):
+        pool = ExecutorPool(ThreadPoolExecutor)
+        calls = []
+
+        def slow(item):
+            calls.append(item)
+            sleep(0.01 if item else 0.3)
+            return item
+
+        iterator = pool.get(2, max_inflight=10)(slow, xrange(100))
+        self.assertEqual(next(iterator), 0)
+        self.assertGreaterEqual(len(calls), 9)
+        self.assertListEqual(list(iterator), list(xrange(1, 100)))
+        self.assertListEqual(list(pool.workers), [2])
+
+    def test_max_inflight_keeps_required_workers(self):
+        for executor_class in (ThreadPoolExecutor, LightThreadPoolExecutor):
+            pool = ExecutorPool(executor_class)
+            self.assertListEqual(list(pool.get(10)(abs, [-1])), [1])
+            lock, running, peak = Lock(), [0], [0]
+
+            def slow(item):
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                sleep(0.01)
+                with lock:
+                    running[0] -= 1
+                return item
+
+            mapper = pool.get(2, max_inflight=10, chunksize=1)
+            self.assertListEqual(list(mapper(slow, xrange(30))),
+                                 list(xrange(30)))
+            self.assertEqual(peak[0], 2)
+
+    def test_timeout(self):
+        stream = Stream([0.0, 0.5, 0.0]).map(sleep, parallel=2, timeout=0.1)
+        self.assertRaises(TimeoutError, list, stream)
+
+        stream = Stream([0.0, 0.01]).map(sleep, parallel=2, timeout=1)
+        self.assertListEqual(list(stream), [None, None])
+
+    def test_hedging(self):
+        attempts = []
+
+        def flaky(item):
+            attempts.append(item)
+            if item == 30 and attempts.count(item) == 1:
+                sleep(2)
+            return item
+
+        started_at = time()
+        stream = Stream.range(40).map(flaky, parallel=4, hedge=0.9)
+        self.assertListEqual(list(stream), list(xrange(40)))
+        self.assertLess(time() - started_at, 1.5)
+        self.assertEqual(attempts.count(30), 2)
+
+    def test_hedging_timeout(self):
+        executor = ThreadPoolExecutor(2)
+        tracker = LatencyTracker(0.5)
+        tracker.threshold = lambda: 0.5
+        released = Event()
+        queue = deque([executor.submit_tracked(tracker, executor.submit,
+                                               released.wait, 2)])
+        started_at = time()
+        self.assertRaises(TimeoutError, executor.get_first_hedged,
+                          released.wait, tracker, queue, 0.2)
+        self.assertLess(time() - started_at, 0.4)
+        released.set()
+        executor.shutdown()
+
+    def test_light_executor(self):
+        pool = ExecutorPool(LightThreadPoolExecutor)
+        iterator = pool.get(3, chunksize=7)(lambda item: item * 2,
+                                            xrange(100))
+        self.assertListEqual(list(iterator),
+                             [item * 2 for item in xrange(100)])
+        self.assertListEqual(list(pool.workers), [3])
+
+        iterator = pool.get(3, chunksize=4)(lambda item: 10 / item,
+                                            [1, 2, 5, 10, 0, 1])
+        self.assertListEqual([next(iterator) for _ in xrange(4)],
+                             [10, 5, 2, 1])
+        self.assertRaises(ZeroDivisionError, next, iterator)
+
+        stream = Stream.range(1000).map(lambda item: item + 1, light=2)
+        self.assertListEqual(list(stream), list(xrange(1, 1001)))
+
+    def test_light_executor_slots(self):
+        executor = LightThreadPoolExecutor(1)
+        future = executor.submit(sleep, 0.2)
+        pending = executor.submit(abs, -1)
+        self.assertTrue(pending.cancel())
+        self.assertRaises(CancelledError, pending.result)
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        self.assertFalse(future.done())
+        self.assertIsNone(future.result())
+        self.assertTrue(future.done())
+        self.assertFalse(future.cancel())
+        self.assertEqual(executor.submit(abs, -1).result(), 1)
+        executor.shutdown()
+
+    def test_interpreters(self):
+        stream = Stream.range(-10, 0).map(abs, interpreters=2)
+        self.assertListEqual(list(stream), list(xrange(10, 0, -1)))
+        self.assertIs(Stream.WORKERS.interpreters.worker_class, CPUExecutor)
+
+
+def start_worker_server():
+    server = WorkerServer(("127.0.0.1", 0))
+    thread = Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def slow_negation(item):
+    sleep(0.01)
+    return -item
+
+
+def fail_to_unpickle():
+    raise ImportError("No module named missing")
+
+
+class Unpicklable(object):
+    def __reduce__(self):
+        return fail_to_unpickle, ()
+
+
+def burn_cpu(item):
+    return sum(xrange(item))
+
+
+class ListHandler(Handler):
+    """
+    Collects formatted log messages (assertLogs is Python 3.4+ only).
+    """
+
+    def __init__(self):
+        Handler.__init__(self, INFO)
+        self.output = []
+
+    def emit(self, record):
+        self.output.append(record.getMessage())
+
+
+class AutoConcurrencyTests(TestCase):
+
+    def assertDecision(self, decision, stream, expected):
+        logger = getLogger("streams.poolofpools")
+        handler, level = ListHandler(), logger.level
+        logger.addHandler(handler)
+        logger.setLevel(INFO)
+        try:
+            self.assertListEqual(list(stream), expected)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(len(handler.output), 1)
+        self.assertIn("Concurrency {0} ".format(decision), handler.output[0])
+
+    def test_serial(self):
+        stream = Stream.range(-100, 0).map(abs, concurrency="auto")
+        self.assertDecision("serial", stream, list(xrange(100, 0, -1)))
+
+    def test_parallel(self):
+        stream = Stream([0.005] * 30).map(sleep, concurrency="auto")
+        self.assertDecision("parallel", stream, [None] * 30)
+
+    def test_interpreters(self):
+        workers = PoolOfPools()
+        workers.default_count = 2
+        stream = workers.get({"concurrency": "auto"})(burn_cpu,
+                                                      [300000] * 25)
+        self.assertDecision("interpreters", stream,
+                            [burn_cpu(300000)] * 25)
+
+    def test_no_thread_time(self):
+        workers = PoolOfPools()
+        workers.default_count = 2
+        self.assertEqual(workers.decide(1.0, None, 0.1, 20), "interpreters")
+        self.assertEqual(workers.decide(1.0, None, 0.9, 20), "parallel")
+        self.assertEqual(workers.decide(1.0, None, float("inf"), 20),
+                         "parallel")
+        self.assertEqual(workers.decide(0.0001, None, 0.0, 20), "serial")
+        workers.default_count = 1
+        self.assertEqual(workers.decide(1.0, None, 0.1, 20), "parallel")
+
+        thread_time = poolofpools.thread_time
+        poolofpools.thread_time = None
+        try:
+            results, _, cpu_time, _ = workers.profile(abs, [-1, -2])
+        finally:
+            poolofpools.thread_time = thread_time
+        self.assertListEqual(results, [1, 2])
+        self.assertIsNone(cpu_time)
+
+
+class ScopedWorkersTests(TestCase):
+
+    def test_workers_keyword(self):
+        workers = PoolOfPools(max_workers=2)
+        stream = Stream.range(-10, 0).map(abs, parallel=8, workers=workers)
+        self.assertEqual(workers.limit.available, 2)
+        iterator = iter(stream)
+        self.assertEqual(next(iterator), 10)
+        self.assertEqual(workers.limit.available, 0)
+        self.assertListEqual(list(iterator), list(xrange(9, 0, -1)))
+        self.assertEqual(workers.limit.available, 2)
+        self.assertListEqual(list(workers.parallels.workers), [2])
+
+        results = Stream.range(3).aggregate(Stream.sum, Stream.count,
+                                            workers=workers)
+        self.assertEqual(results, (3, 3))
+        self.assertEqual(workers.limit.available, 2)
+        results = Stream.range(100).aggregate(
+            Stream.sum, Stream.count, Stream.median, max_lag=10,
+            workers=workers)
+        self.assertEqual(results, (4950, 100, 50))
+        self.assertEqual(workers.limit.available, 2)
+
+    def test_aggregate_with_busy_workers(self):
+        workers = PoolOfPools(max_workers=3)
+        holder = Thread(target=workers.limit.acquire, args=(2,))
+        holder.start()
+        holder.join()
+        functions = Stream.sum, Stream.count, Stream.median
+
+        Timer(0.05, workers.limit.release, args=(2,)).start()
+        results = Stream.range(100).aggregate(*functions, max_lag=10,
+                                              workers=workers)
+        self.assertEqual(results, (4950, 100, 50))
+        self.assertEqual(workers.limit.available, 3)
+
+        def nested(item):
+            return Stream.range(item).aggregate(*functions, max_lag=10,
+                                                workers=workers)
+
+        mapper = workers.parallel(2)
+        self.assertListEqual(list(mapper(nested, [10, 100])),
+                             [(45, 10, 5), (4950, 100, 50)])
+        self.assertEqual(workers.limit.available, 3)
+
+    def test_workers_are_taken_on_iteration(self):
+        workers = PoolOfPools(max_workers=2)
+        stream = Stream.range(-10, 0).map(abs, parallel=2, workers=workers)
+        stream = stream.map(abs, parallel=2, workers=workers)
+        self.assertEqual(workers.limit.available, 2)
+
+        results = []
+        thread = Thread(target=lambda: results.extend(stream))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertListEqual(results, list(xrange(10, 0, -1)))
+        self.assertEqual(workers.limit.available, 2)
+
+        iterator = iter(Stream.range(10).map(abs, parallel=2,
+                                             workers=workers))
+        next(iterator)
+        self.assertEqual(workers.limit.available, 0)
+        iterator.close()
+        self.assertEqual(workers.limit.available, 2)
+
+    def test_context_manager(self):
+        workers = PoolOfPools()
+        other_thread_workers = []
+        with workers:
+            self.assertIs(Stream.WORKERS, workers)
+            thread = Thread(
+                target=lambda: other_thread_workers.append(Stream.WORKERS))
+            thread.start()
+            thread.join()
+            with PoolOfPools() as inner_workers:
+                self.assertIs(Stream.WORKERS, inner_workers)
+            self.assertIs(Stream.WORKERS, workers)
+        self.assertIsNot(Stream.WORKERS, workers)
+        self.assertIs(other_thread_workers[0], Stream.WORKERS)
+
+    def test_nested_streams_do_not_wait_for_limit(self):
+        workers = PoolOfPools(max_workers=2, wait=True)
+
+        def inner(item):
+            stream = Stream.range(item * 10, item * 10 + 10)
+            return sum(stream.map(abs, parallel=2, workers=workers))
+
+        results = []
+        thread = Thread(target=lambda: results.extend(
+            Stream.range(4).map(inner, parallel=2, workers=workers)))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertListEqual(results, [45, 145, 245, 345])
+        self.assertEqual(workers.limit.available, 2)
+
+    def test_strict_workers(self):
+        workers = PoolOfPools(max_workers=3)
+        holder = Thread(target=workers.limit.acquire, args=(2,))
+        holder.start()
+        holder.join()
+        self.assertEqual(workers.limit.available, 1)
+        self.assertListEqual(list(workers.parallel(2)(abs, [-1, -2])),
+                             [1, 2])
+        self.assertRaises(WorkersUnavailable, list,
+                          workers.parallel(4, strict=True)(abs, [-1]))
+
+        outer = iter(workers.parallel(1)(abs, [-1, -2]))
+        self.assertEqual(next(outer), 1)
+        self.assertEqual(workers.limit.available, 0)
+        self.assertRaises(WorkersUnavailable, list,
+                          workers.parallel(2, strict=True)(abs, [-1]))
+        outer.close()
+
+        Timer(0.05, workers.limit.release, args=(2,)).start()
+        mapper = workers.parallel(3, strict=True)
+        self.assertListEqual(list(mapper(abs, [-1, -2, -3])), [1, 2, 3])
+        self.assertEqual(workers.limit.available, 3)
+
+    def test_limits(self):
+        limit = WorkerLimit(3)
+        self.assertEqual(limit.acquire(2), 2)
+        self.assertEqual(limit.acquire(5), 1)
+        limit.release(3)
+
+        limit = WorkerLimit(3, wait=True)
+        self.assertEqual(limit.acquire(2), 2)
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(limit.acquire(2)))
+        thread.start()
+        sleep(0.05)
+        self.assertListEqual(acquired, [])
+        limit.release(2)
+        thread.join()
+        self.assertListEqual(acquired, [2])
+
+
+class RemoteExecutorTests(TestCase):
+
+    def setUp(self):
+        self.servers = [start_worker_server() for _ in xrange(2)]
+        self.addresses = [server.server_address for server in self.servers]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_map(self):
+        pool = ExecutorPool(RemoteExecutor, addresses=self.addresses)
+        iterator = pool.get(4, chunksize=3)(abs, xrange(-50, 0))
+        self.assertListEqual(list(iterator), list(xrange(50, 0, -1)))
+
+        iterator = pool.get(2, chunksize=3)(divmod, [4, 2, 1], [2, 1, 0])
+        self.assertListEqual([next(iterator), next(iterator)],
+                             [(2, 0), (2, 0)])
+        self.assertRaises(ZeroDivisionError, next, iterator)
+
+        executor = RemoteExecutor(1, self.addresses)
+        self.assertEqual(executor.submit(pow, 2, 10).result(), 1024)
+        self.assertRaises(TypeError, executor.submit(pow, 2).result)
+        executor.shutdown()
+
+    def test_worker_loss(self):
+        workers = PoolOfPools()
+        workers.connect(["{0}:{1}".format(*address)
+                         for address in self.addresses])
+        mapper = workers.get({"remote": True, "chunksize": 5})
+        iterator = mapper(slow_negation, xrange(200))
+        self.assertEqual(next(iterator), 0)
+        self.servers[0].stop()
+        self.assertListEqual(list(iterator), list(xrange(-1, -200, -1)))
+        self.servers.pop(0)
+
+    def test_task_errors_keep_connection(self):
+        executor = RemoteExecutor(1, self.addresses[:1])
+        future = executor.submit(abs, Unpicklable())
+        self.assertRaises(ImportError, future.result, 5)
+        self.assertEqual(executor.submit(abs, -1).result(5), 1)
+        self.assertEqual(executor.lost_addresses, {})
+        self.assertEqual(len(executor.connections), 1)
+        executor.shutdown()
+
+    def test_lost_worker_is_retried(self):
+        executor = RemoteExecutor(1, self.addresses[:1])
+        executor.RETRY_DELAY = 0.05
+        self.assertEqual(executor.submit(abs, -1).result(5), 1)
+        executor.lose(self.addresses[0], executor.connections[0])
+        self.assertEqual(executor.connections, [])
+        self.assertRaises(SocketError, executor.connect)
+        sleep(0.05)
+        address, connection = executor.connect()
+        self.assertEqual(address, self.addresses[0])
+        self.assertEqual(executor.lost_addresses, {})
+        self.assertListEqual(executor.connections, [connection])
+        executor.shutdown()
+
+    def test_not_connected(self):
+        self.assertRaises(ValueError, PoolOfPools().get, {"remote": 2})
+
+
+@skipIf(GeventExecutor is None, "gevent is not installed")
+class GeventExecutorTests(TestCase):
+
+    def test_pool_size(self):
+        pool = ExecutorPool(GeventExecutor)
+        iterator = pool.get(3)(gevent_sleep, [0.01] * 4)
+        self.assertListEqual(list(iterator), [None] * 4)
+        executor = pool.workers[3][0]
+        self.assertEqual(executor.worker_pool.size, 3)
+
+        executor.expand(2)
+        self.assertEqual(executor.worker_pool.size, 5)
+        self.assertEqual(executor.worker_pool.free_count(), 5)
+        greenlets = [executor.worker_pool.spawn(gevent_sleep, 0.01)
+                     for _ in xrange(5)]
+        self.assertTrue(executor.worker_pool.full())
+        joinall(greenlets)
+
+        running = executor.worker_pool.spawn(gevent_sleep, 0.01)
+        executor.expand(1)
+        self.assertEqual(executor.worker_pool.size, 6)
+        self.assertEqual(executor.worker_pool.free_count(), 5)
+        running.join()
+        gevent_sleep(0)
+        self.assertEqual(executor.worker_pool.free_count(), 6)
+
+    def test_map(self):
+        pool = ExecutorPool(GeventExecutor)
+
+        def slow(item):
+            gevent_sleep(0.01 * (5 - item))
+            return item
+
+        self.assertListEqual(list(pool.get(5)(slow, xrange(5))),
+                             list(xrange(5)))
+        self.assertListEqual(
+            list(pool.get(5, max_inflight=5)(slow, xrange(5))),
+            list(xrange(5)))
+        iterator = pool.get(2)(lambda item: 1 / item, [1, 0, 2])
+        self.assertRaises(ZeroDivisionError, list, iterator)
+        iterator = pool.get(2, timeout=0.05)(gevent_sleep, [0.0, 0.5])
+        self.assertRaises(TimeoutError, list, iterator)
+
+    def test_required_workers(self):
+        pool = ExecutorPool(GeventExecutor)
+        self.assertListEqual(list(pool.get(10)(abs, [-1])), [1])
+        running, peak = [0], [0]
+
+        def slow(item):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            gevent_sleep(0.01)
+            running[0] -= 1
+            return item
+
+        self.assertListEqual(list(pool.get(2)(slow, xrange(20))),
+                             list(xrange(20)))
+        self.assertEqual(peak[0], 2)
+
+    def test_future(self):
+        executor = GeventExecutor(2)
+        future = executor.submit(gevent_sleep, 0.5)
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        self.assertTrue(future.cancel())
+        self.assertRaises(CancelledError, future.result)
+
+        future = executor.submit(abs, -1)
+        self.assertEqual(future.result(), 1)
+        self.assertTrue(future.done())
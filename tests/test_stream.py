@@ -3,9 +3,18 @@
 
 ###############################################################################
 
+from gzip import open as gzip_open
 from itertools import chain
 from operator import add, itemgetter
+from os import close, remove
+from os.path import abspath, dirname
+from subprocess import check_output
+from sys import executable
 from random import shuffle
+from threading import Thread, current_thread
+from time import sleep, time
+from shutil import rmtree
+from tempfile import mkdtemp, mkstemp
 
 try:
     from cdecimal import Decimal
@@ -24,10 +33,34 @@ if PY3:
     long = int
 
 from streams import Stream
+from streams.iterators import TeeBuffer
+from streams.storage import Memoizer
+from streams.utils import RollingCount, RollingMax, RollingMin, RollingSum
 
 
 ###############################################################################
+SQUARED = []
+
+
+def square(item):
+    SQUARED.append(item)
+    return item ** 2
+
+
 class StreamTests(TestCase):
+    def make_file(self, content):
+        handle, path = mkstemp()
+        close(handle)
+        with open(path, "wb") as file_handler:
+            file_handler.write(content)
+        self.addCleanup(remove, path)
+        return path
+
+    def make_dir(self):
+        path = mkdtemp()
+        self.addCleanup(rmtree, path)
+        return path
+
     def test_no_cache(self):
         # Make a normal stream.
         stream = Stream.range(10)
@@ -51,6 +84,73 @@ class StreamTests(TestCase):
         # Iterate twice, this time from the cache. We get the last 5 values.
         self.assertEqual(list(stream), list(range(5, 10)))
 
+    def test_compact_cache(self):
+        stream = Stream.range(100).cache(spill=10)
+        self.assertListEqual(list(stream), list(xrange(100)))
+        self.assertListEqual(list(stream), list(xrange(100)))
+        self.assertEqual(len(stream._cache.items), 10)
+
+        stream = Stream.range(3).map(float).cache(typecode="d")
+        self.assertListEqual(list(stream), [0.0, 1.0, 2.0])
+        self.assertListEqual(list(stream), [0.0, 1.0, 2.0])
+
+    #   stream.fork()
+    def test_fork(self):
+        first, second, third = Stream.range(10).fork(3)
+        self.assertListEqual(list(first), list(xrange(10)))
+        self.assertListEqual(list(second.limit(3)), [0, 1, 2])
+        self.assertEqual(third.sum(), 45)
+
+    def test_fork_keeps_only_lagging_items(self):
+        first, second = Stream.range(100).fork(max_lag=10)
+        first_iterator, second_iterator = iter(first), iter(second)
+        for expected in xrange(100):
+            self.assertEqual(next(first_iterator), expected)
+            self.assertEqual(next(second_iterator), expected)
+
+        buffer_ = TeeBuffer(xrange(100), 2, max_lag=10)
+        first, second = buffer_.branch(0), buffer_.branch(1)
+        consumed = []
+        thread = Thread(target=lambda: consumed.extend(first))
+        thread.daemon = True
+        thread.start()
+        sleep(0.1)
+        self.assertListEqual(consumed, list(xrange(10)))
+        self.assertEqual(len(buffer_.items), 10)
+        self.assertListEqual([next(second) for _ in xrange(5)],
+                             list(xrange(5)))
+        sleep(0.1)
+        self.assertLessEqual(len(buffer_.items), 10)
+        self.assertListEqual(list(second), list(xrange(5, 100)))
+        thread.join(5)
+        self.assertListEqual(consumed, list(xrange(100)))
+        self.assertEqual(len(buffer_.items), 0)
+
+    #   stream.aggregate()
+    def test_aggregate(self):
+        stream = Stream.range(10000)
+        results = stream.aggregate(Stream.sum, Stream.count,
+                                   lambda branch: branch.limit(2).sum(),
+                                   max_lag=10)
+        self.assertEqual(results, (sum(xrange(10000)), 10000, 1))
+        self.assertEqual(Stream.range(10).aggregate(), ())
+
+    #   import streams
+    def test_import_is_lazy(self):
+        code = ("import sys, time; started_at = time.time(); "
+                "import streams; print(time.time() - started_at); "
+                "print(' '.join(sys.modules))")
+        output = check_output([executable, "-c", code],
+                              cwd=dirname(dirname(abspath(__file__))))
+        elapsed, modules = output.decode("utf-8").splitlines()
+        modules = set(modules.split())
+        for module in ("concurrent.futures", "multiprocessing",
+                       "repoze.lru", "gevent"):
+            self.assertNotIn(module, modules)
+        self.assertLess(float(elapsed), 1.0)
+
+        self.assertIs(Stream.WORKERS, Stream.WORKERS)
+
     #   Stream class methods
     def test_it_should_produce_a_range(self):
         stream = Stream.range(10)
@@ -109,6 +209,32 @@ class StreamTests(TestCase):
     def test_average(self):
         self.assertAlmostEqual(Stream(xrange(200)).average(), 99.5)
 
+    #   stream.batch()
+    def test_batch(self):
+        stream = Stream.range(5).batch(2)
+        self.assertListEqual(list(stream), [[0, 1], [2, 3], [4]])
+        self.assertListEqual(list(Stream.range(4).batch(2)),
+                             [[0, 1], [2, 3]])
+        self.assertListEqual(list(Stream([]).batch(2)), [])
+
+        stream = Stream.range(5).batch(2, max_wait=10)
+        self.assertListEqual(list(stream), [[0, 1], [2, 3], [4]])
+
+    def test_batch_flushes_slow_source(self):
+        def slow(item):
+            if item == 3:
+                sleep(0.5)
+            return item
+
+        stream = Stream.iterate(lambda item: item + 1, 0).map(slow)
+        batches = iter(stream.batch(10, max_wait=0.1))
+        self.assertListEqual(next(batches), [0, 1, 2])
+        self.assertListEqual(next(batches), list(xrange(3, 13)))
+
+    def test_batch_reraises_errors(self):
+        stream = Stream([1, 0]).map(lambda item: 1 / item)
+        self.assertRaises(ZeroDivisionError, list, stream.batch(2, 1))
+
     #   stream.chain()
     def test_it_should_chain_iterables_together(self):
         stream = Stream((range(10), range(10)))
@@ -182,6 +308,41 @@ class StreamTests(TestCase):
         self.assertListEqual(list(not_none),
                              [i for i in items if i is not None])
 
+    #   Stream.from_file()
+    def test_from_file(self):
+        content = [str(item).encode("ascii") for item in xrange(1000)]
+        content = b"\n".join(content)
+        path = self.make_file(content + b"\n")
+
+        stream = Stream.from_file(path)
+        lines = list(stream.map(bytes))
+        self.assertEqual(len(lines), 1000)
+        self.assertEqual(lines[:2], [b"0", b"1"])
+        self.assertEqual(lines[-1], b"999")
+
+        stream = Stream.from_file(path, mmap=False, parser=int)
+        self.assertListEqual(list(stream), list(xrange(1000)))
+
+        for kwargs in ({"parallel": 3}, {"process": 2}):
+            stream = Stream.from_file(path, parser=int, chunk_size=100,
+                                      **kwargs)
+            self.assertListEqual(list(stream), list(xrange(1000)))
+
+        path = self.make_file(content)
+        stream = Stream.from_file(path, chunk_size=7, parallel=2)
+        self.assertEqual(list(stream)[-1], b"999")
+        self.assertListEqual(list(Stream.from_file(self.make_file(b""))), [])
+
+        path = self.make_file(b"1\r\n2\r\n\r\n3")
+        for kwargs in ({}, {"mmap": False}, {"parallel": 2}):
+            stream = Stream.from_file(path, **kwargs).map(bytes)
+            self.assertListEqual(list(stream), [b"1", b"2", b"", b"3"])
+
+        path = self.make_file(b"1\r\r\n\n\r\n2\n\r")
+        for kwargs in ({}, {"mmap": False}, {"parallel": 2}):
+            stream = Stream.from_file(path, **kwargs).map(bytes)
+            self.assertListEqual(list(stream), [b"1\r", b"", b"", b"2", b""])
+
     #   stream.first
     def test_it_should_return_the_first_element_without_consuming_it(self):
         stream = Stream.range(10)
@@ -234,6 +395,80 @@ class StreamTests(TestCase):
         ints = stream.ints()
         self.assertListEqual(list(ints), [int(i) for i in items[0:-2]])
 
+    #   stream.join()
+    def test_join(self):
+        users = [(1, "alice"), (2, "bob"), (4, "carol")]
+        orders = [(1, "book"), (1, "pen"), (3, "cup"), (4, "tea")]
+
+        for algorithm in ("hash", "merge"):
+            joined = Stream(users).join(orders, algorithm=algorithm)
+            self.assertListEqual(
+                list(joined),
+                [(1, ("alice", "book")), (1, ("alice", "pen")),
+                 (4, ("carol", "tea"))])
+            joined = Stream(users).join(orders, how="outer",
+                                        algorithm=algorithm)
+            self.assertListEqual(
+                sorted(joined, key=lambda item: (item[0], str(item[1]))),
+                [(1, ("alice", "book")), (1, ("alice", "pen")),
+                 (2, ("bob", None)), (3, (None, "cup")),
+                 (4, ("carol", "tea"))])
+            joined = Stream(orders).join(users, how="right",
+                                         algorithm=algorithm)
+            self.assertListEqual(
+                sorted(joined, key=lambda item: (item[0], str(item[1]))),
+                [(1, ("book", "alice")), (1, ("pen", "alice")),
+                 (2, (None, "bob")), (4, ("tea", "carol"))])
+
+    def test_join_builds_smaller_side(self):
+        reads = []
+
+        class ReadCounter(object):
+            def __init__(self, name, items):
+                self.name, self.items = name, list(items)
+
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                if not self.items:
+                    raise StopIteration
+                reads.append(self.name)
+                return self.items.pop(0)
+            next = __next__
+
+            def __length_hint__(self):
+                return len(self.items)
+
+        joined = Stream(ReadCounter("left", xrange(10))).join(
+            ReadCounter("right", xrange(5, 100)), how="left")
+        self.assertListEqual(
+            sorted(joined),
+            [(item, (item, None)) for item in xrange(5)] +
+            [(item, (item, item)) for item in xrange(5, 10)])
+        self.assertListEqual(reads[:10], ["left"] * 10)
+
+        del reads[:]
+        joined = Stream(ReadCounter("left", xrange(5, 100))).join(
+            ReadCounter("right", xrange(10)), how="right")
+        self.assertEqual(len(list(joined)), 10)
+        self.assertListEqual(reads[:10], ["right"] * 10)
+
+    def test_join_with_key_and_spilling(self):
+        left = Stream.range(1000)
+        right = Stream.range(0, 2000, 2)
+        joined = left.join(right, key=lambda item: item % 500,
+                           memory_limit=100)
+        self.assertEqual(joined.count(), 2000)
+
+        joined = Stream.range(1000).join(Stream.range(0, 2000, 2),
+                                         how="outer", memory_limit=100)
+        joined = sorted(joined)
+        self.assertEqual(len(joined), 1500)
+        self.assertEqual(joined[:3], [(0, (0, 0)), (1, (1, None)),
+                                      (2, (2, 2))])
+        self.assertEqual(joined[-1], (1998, (None, 1998)))
+
     #   stream.key_map()
     def test_it_should_map_a_predicate_to_keys_in_key_value_pairs(self):
         items = range(10)
@@ -281,6 +516,60 @@ class StreamTests(TestCase):
         stream = stream.values().skip(10).limit(3)
         self.assertListEqual(list(stream), [10, 11, 12])
 
+    #   stream.map_batched()
+    def test_map_batched(self):
+        sizes = []
+
+        def bulk(items):
+            sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        stream = Stream.range(25).map_batched(bulk, max_batch=10, parallel=3)
+        self.assertListEqual(list(stream), [item * 2 for item in xrange(25)])
+        self.assertListEqual(sorted(sizes), [5, 10, 10])
+
+        stream = Stream.range(5).map_batched(lambda items: items[1:])
+        self.assertRaises(ValueError, list, stream)
+
+    def test_memoized_map(self):
+        calls = SQUARED
+        del calls[:]
+
+        items = [1, 2, 1, 3, 2, 1, 4] * 10
+        expected = [item ** 2 for item in items]
+        self.assertListEqual(list(Stream(items).map(square, memoize=True)),
+                             expected)
+        self.assertListEqual(sorted(calls), [1, 2, 3, 4])
+
+        memoizer = Memoizer(2, self.make_dir() + "/cache")
+        stream = Stream(items).map(square, memoize=memoizer, parallel=3)
+        self.assertListEqual(list(stream), expected)
+        self.assertEqual(memoizer.hits + memoizer.misses, len(items))
+        self.assertGreater(memoizer.hits, 0)
+
+        del calls[:]
+        stream = Stream([[1], [2], [1]]).map(len, memoize=2)
+        self.assertListEqual(list(stream), [1, 1, 1])
+        stream = Stream(items).map(square, memoize=memoizer)
+        self.assertListEqual(list(stream), expected)
+        self.assertListEqual(calls, [])
+        stream = Stream(items).map(lambda item: -item, memoize=memoizer)
+        self.assertListEqual(list(stream), [-item for item in items])
+        stream = Stream([1, 2]).map(lambda item: item * 100,
+                                    memoize=memoizer)
+        self.assertListEqual(list(stream), [100, 200])
+
+        def make(factor):
+            return lambda item: item * factor
+
+        for factor in (2, 3):
+            stream = Stream([1, 2]).map(make(factor), memoize=memoizer)
+            self.assertListEqual(list(stream), [factor, factor * 2])
+        memoizer.close()
+
+        stream = Stream([1, 1.0, True]).map(type, memoize=True)
+        self.assertListEqual(list(stream), [int, float, bool])
+
     #   stream.median()
     def test_it_should_find_the_median(self):
         self.assertEqual(Stream(xrange(10)).median(), 5)
@@ -355,10 +644,104 @@ class StreamTests(TestCase):
         stream = Stream.range(10)
         self.assertEqual(side_list, list(stream.peek(side_list.append)))
 
+    #   Stream.pipeline()
+    def test_pipeline(self):
+        threads = set()
+
+        def slow(item):
+            threads.add(current_thread())
+            sleep(0.02)
+            return item
+
+        stream = Stream.range(20).map(slow).peek(slow).map(slow)
+        started_at = time()
+        with Stream.pipeline(4):
+            self.assertEqual(stream.sum(), sum(xrange(20)))
+        self.assertLess(time() - started_at, 1.0)
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(current_thread(), threads)
+
+        stream = Stream.range(5).cache()
+        self.assertListEqual(list(stream), list(xrange(5)))
+        with Stream.pipeline():
+            self.assertListEqual(list(stream.map(slow)), list(xrange(5)))
+
+        threads.clear()
+        self.assertEqual(Stream.range(3).map(slow).count(), 3)
+        self.assertEqual(threads, set([current_thread()]))
+
+    #   stream.prefetch()
+    def test_prefetch(self):
+        self.assertListEqual(list(Stream.range(100).prefetch(3)),
+                             list(xrange(100)))
+
+        def slow(item):
+            sleep(0.05)
+            return item
+
+        started_at = time()
+        stream = Stream.range(10).map(slow).prefetch(10).map(slow)
+        self.assertListEqual(list(stream), list(xrange(10)))
+        self.assertLess(time() - started_at, 0.9)
+
+        stream = Stream([1, 0]).map(lambda item: 1 / item).prefetch()
+        self.assertRaises(ZeroDivisionError, list, stream)
+
     #   Stream.range()
     def test_range(self):
         self.assertListEqual(list(Stream.range(100)), list(xrange(100)))
 
+    #   Stream.read_csv()
+    def test_read_csv(self):
+        content = [b"id,name,price"]
+        content.extend(("{0},book {0},{1}".format(item, item * 10)
+                        .encode("utf-8") for item in xrange(100)))
+        path = self.make_file(b"\r\n".join(content) + b"\r\n")
+
+        records = list(Stream.read_csv(path, chunk_size=64))
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records[3], {"id": "3", "name": "book 3",
+                                      "price": "30"})
+
+        stream = Stream.read_csv(path, columns=["price", "id"],
+                                 chunk_size=64, process=2)
+        self.assertListEqual(
+            list(stream),
+            [{"id": str(item), "price": str(item * 10)}
+             for item in xrange(100)])
+
+        stream = Stream.read_csv(path, columns=[0], header=False,
+                                 parallel=2)
+        self.assertListEqual(list(stream),
+                             [["id"]] + [[str(item)] for item in xrange(100)])
+
+        # on Python 2 header cells are decoded the same way as values
+        path = self.make_file(u"id,n\u00e4me\n1,\u00e9t\u00e9\n"
+                              .encode("utf-8"))
+        for columns in (None, [u"n\u00e4me"]):
+            records = list(Stream.read_csv(path, columns=columns))
+            self.assertEqual(records[-1][u"n\u00e4me"], u"\u00e9t\u00e9")
+            for record in records:
+                for key, value in record.items():
+                    self.assertIsInstance(key, text_type)
+                    self.assertIsInstance(value, text_type)
+
+    #   Stream.read_jsonl()
+    def test_read_jsonl(self):
+        content = ('{{"id": {0}, "payload": "{1}"}}'.format(item, "x" * item)
+                   for item in xrange(100))
+        content = "\n\n".join(content).encode("utf-8")
+        path = self.make_file(content)
+
+        records = list(Stream.read_jsonl(path, chunk_size=100))
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records[2], {"id": 2, "payload": "xx"})
+
+        stream = Stream.read_jsonl(path, columns=["id"], chunk_size=100,
+                                   process=2)
+        self.assertListEqual(list(stream),
+                             [{"id": item} for item in xrange(100)])
+
     #   stream.reduce()
     def test_it_should_reduce_the_stream(self):
         stream = Stream.range(10)
@@ -389,6 +772,33 @@ class StreamTests(TestCase):
         reverse = reversed(stream)
         self.assertListEqual(list(reverse), list(reversed(range(10))))
 
+    #   stream.rolling()
+    def test_rolling(self):
+        stream = Stream.range(5).rolling(2)
+        self.assertListEqual(list(stream), [0.5, 1.5, 2.5, 3.5])
+
+        stream = Stream.range(5).rolling(3, RollingSum)
+        self.assertListEqual(list(stream), [3, 6, 9])
+
+        stream = Stream([3, 1, 2, 5, 4, 0]).rolling(3, RollingMax)
+        self.assertListEqual(list(stream), [3, 5, 5, 5])
+
+        stream = Stream([3, 1, 2, 5, 4, 0]).rolling(3, RollingMin)
+        self.assertListEqual(list(stream), [1, 1, 2, 0])
+
+    def test_time_rolling(self):
+        stream = Stream([1, 2, 3, 10, 11, 20])
+        stream = stream.rolling(5, RollingCount, timestamp=lambda item: item)
+        self.assertListEqual(list(stream), [1, 2, 3, 1, 2, 1])
+
+    #   stream.session_window()
+    def test_session_window(self):
+        stream = Stream([1, 2, 3, 10, 11, 20])
+        stream = stream.session_window(2, lambda item: item)
+        self.assertListEqual(list(stream), [(1, 2, 3), (10, 11), (20,)])
+        self.assertListEqual(
+            list(Stream([]).session_window(2, lambda item: item)), [])
+
     #   stream.skip()
     def test_it_should_skip_the_first_n_items(self):
         stream = Stream(range(20))
@@ -446,6 +856,67 @@ class StreamTests(TestCase):
         self.assertEqual(decimal_result, Decimal("10"))
         self.assertIsInstance(decimal_result, Decimal)
 
+    #   stream.time_window()
+    def test_time_window(self):
+        stream = Stream([1, 2, 5, 6, 11]).time_window(5, lambda item: item)
+        self.assertListEqual(list(stream), [(1, 2), (5, 6), (11,)])
+
+        stream = Stream([1, 2, 5, 6, 11])
+        stream = stream.time_window(4, lambda item: item, step=2)
+        self.assertListEqual(
+            list(stream),
+            [(1,), (1, 2), (2, 5), (5, 6), (6,), (11,), (11,)])
+
+    #   stream.to_csv()
+    def test_to_csv(self):
+        path = self.make_dir() + "/books.csv"
+        stream = Stream.range(100).map(lambda item: {"id": item,
+                                                     "name": "b" + str(item),
+                                                     "extra": None})
+        written = stream.to_csv(path, columns=["id", "name"], batch_size=7)
+        self.assertListEqual(written, [path])
+        self.assertListEqual(
+            list(Stream.read_csv(path)),
+            [{"id": str(item), "name": "b" + str(item)}
+             for item in xrange(100)])
+
+        path = self.make_dir() + "/names.csv"
+        Stream([[u"\u00e9t\u00e9", 1]]).to_csv(path)
+        with open(path, "rb") as file_handler:
+            self.assertEqual(file_handler.read().strip(),
+                             u"\u00e9t\u00e9,1".encode("utf-8"))
+
+    #   stream.to_file()
+    def test_to_file(self):
+        path = self.make_dir() + "/numbers.txt"
+        written = Stream.range(1000).to_file(path, batch_size=100,
+                                             max_size=1000, parallel=2)
+        self.assertEqual(len(written), 5)
+        self.assertEqual(written[:2], [path, path + ".1"])
+        lines = Stream(written).map(Stream.from_file).chain().map(int)
+        self.assertListEqual(list(lines), list(xrange(1000)))
+
+        path = self.make_dir() + "/numbers-{0}.txt.gz"
+        written = Stream.range(1000).to_file(path, batch_size=100,
+                                             compression="gzip", process=2)
+        self.assertListEqual(written, [path.format(0)])
+        with gzip_open(written[0], "rb") as file_handler:
+            lines = [int(line) for line in file_handler]
+        self.assertListEqual(lines, list(xrange(1000)))
+
+        path = self.make_dir() + "/{batch}-{0}.txt"
+        written = Stream.range(10).to_file(path, batch_size=5,
+                                           max_size=10)
+        self.assertEqual(written[:2], [path.replace("{0}", "0"),
+                                       path.replace("{0}", "1")])
+
+    #   stream.to_jsonl()
+    def test_to_jsonl(self):
+        path = self.make_dir() + "/events.jsonl"
+        records = [{"id": item, "tags": ["a", "b"]} for item in xrange(10)]
+        Stream(records).to_jsonl(path)
+        self.assertListEqual(list(Stream.read_jsonl(path)), records)
+
     #   stream.tuplify()
     def test_it_should_expand_a_stream_to_tuples(self):
         tuples = Stream.range(10).tuplify()
@@ -466,3 +937,17 @@ class StreamTests(TestCase):
                                  range(20, 30))) + ['foo'])
         values = stream.values()
         self.assertListEqual(list(values), list(range(20, 30)) + ['foo'])
+
+    #   stream.window()
+    def test_window(self):
+        stream = Stream.range(5).window(2)
+        self.assertListEqual(list(stream), [(0, 1), (2, 3)])
+
+        stream = Stream.range(5).window(2, partial=True)
+        self.assertListEqual(list(stream), [(0, 1), (2, 3), (4,)])
+
+        stream = Stream.range(5).window(3, 1)
+        self.assertListEqual(list(stream), [(0, 1, 2), (1, 2, 3), (2, 3, 4)])
+
+        stream = Stream.range(7).window(2, 3)
+        self.assertListEqual(list(stream), [(0, 1), (3, 4)])